@@ -0,0 +1,56 @@
+"""Open a large assembly archive and load a single part, compared to
+validating the complete JSON document.
+
+Run with `python benchmarks/archive.py [parts]`.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import cadquery as cq
+from generators import make_boxes_assembly
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import AssemblyArchive, patch_cadquery, write_assembly_archive
+
+patch_cadquery()
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main(parts: int):
+    assembly = make_boxes_assembly(parts)
+    adapter = TypeAdapter(cq.Assembly)
+    name = f"top/part_{parts // 2}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "assembly.cqa")
+        _, write_time = timed(lambda: write_assembly_archive(assembly, path))
+        archive, open_time = timed(lambda: AssemblyArchive(path))
+        part, load_time = timed(lambda: archive.load(name))
+        assert abs(part.obj.Volume() - (1 + parts // 2 * 1e-3)) < 1e-9
+        _, load_all_time = timed(lambda: archive.load())
+        print(
+            f"archive ({parts} parts, {os.path.getsize(path) / 1e6:.1f} MB): "
+            f"write {write_time * 1e3:.1f} ms, open {open_time * 1e3:.1f} ms, "
+            f"load one part {load_time * 1e3:.1f} ms, "
+            f"load all {load_all_time * 1e3:.1f} ms"
+        )
+        archive.close()
+
+    payload, dump_time = timed(lambda: adapter.dump_json(assembly))
+    _, validate_time = timed(lambda: adapter.validate_json(payload))
+    print(
+        f"json ({len(payload) / 1e6:.1f} MB): dump {dump_time * 1e3:.1f} ms, "
+        f"validate {validate_time * 1e3:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,66 @@
+"""Compare the MessagePack envelope with model_dump_json for a model holding
+a workplane and an assembly, with text BREP and compressed binary BREP.
+
+Run with `python benchmarks/binary_envelope.py [parts]`.
+"""
+
+import sys
+import time
+from functools import partial
+
+import cadquery as cq
+from generators import make_parts_assembly, make_workplane_chain
+from pydantic import BaseModel
+
+from cadquery_pydantic import (
+    dump_msgpack,
+    patch_cadquery,
+    serialization_options,
+    validate_msgpack,
+)
+
+patch_cadquery()
+
+
+class Document(BaseModel):
+    history: cq.Workplane
+    assembly: cq.Assembly
+
+
+def best_time(func, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(parts: int):
+    document = Document(
+        history=make_workplane_chain(2000), assembly=make_parts_assembly(parts)
+    )
+    for label, options in (
+        ("text", {}),
+        ("binary", {"brep_format": "binary"}),
+        ("binary+zlib", {"brep_format": "binary", "compression": "zlib"}),
+    ):
+        with serialization_options(**options):
+            payload = document.model_dump_json()
+            data = dump_msgpack(document)
+            print(
+                f"{label:>12} json: {len(payload) / 1e6:6.2f} MB, "
+                f"dump {best_time(document.model_dump_json) * 1e3:7.1f} ms, "
+                f"validate "
+                f"{best_time(partial(Document.model_validate_json, payload)) * 1e3:7.1f} ms"
+            )
+            print(
+                f"{label:>12} msgpack: {len(data) / 1e6:6.2f} MB, "
+                f"dump {best_time(partial(dump_msgpack, document)) * 1e3:7.1f} ms, "
+                f"validate "
+                f"{best_time(partial(validate_msgpack, data, Document)) * 1e3:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
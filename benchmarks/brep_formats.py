@@ -0,0 +1,46 @@
+"""Compare payload size and speed of the text and binary BREP formats.
+
+Run with `python benchmarks/brep_formats.py`.
+"""
+
+import time
+from functools import partial
+
+import cadquery as cq
+from generators import make_freeform_solid, make_solid
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import patch_cadquery, serialization_options
+
+patch_cadquery()
+
+
+def timed(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    adapter = TypeAdapter(cq.Shape)
+
+    for name, part in (("plate", make_solid()), ("freeform", make_freeform_solid())):
+        print(f"{name} with {len(part.Faces())} faces")
+        for brep_format in ("text", "binary"):
+            with serialization_options(brep_format=brep_format):
+                raw = adapter.dump_python(part)["brep"]
+                payload = adapter.dump_json(part)
+                dump = timed(partial(adapter.dump_json, part))
+                validate = timed(partial(adapter.validate_json, payload))
+            print(
+                f"{brep_format:>8}: {len(raw) / 1e3:9.1f} kB raw, "
+                f"{len(payload) / 1e3:9.1f} kB json, "
+                f"dump {dump * 1e3:7.1f} ms, validate {validate * 1e3:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compare two result files written by `benchmarks/run.py`.
+
+Run with `python benchmarks/compare.py baseline.json current.json`.
+Prints the ratio current/baseline for every metric, values above 1 are
+regressions.
+"""
+
+import argparse
+import json
+
+METRICS = ("payload_bytes", "dump_s", "validate_s", "peak_memory_bytes")
+
+
+def load(path: str) -> dict[tuple[str, str], dict]:
+    with open(path) as f:
+        report = json.load(f)
+    return {(r["case"], r["mode"]): r for r in report["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="Mark ratios above this value as regressions",
+    )
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+
+    print(f"{'case':>24} {'mode':>6} " + " ".join(f"{m:>18}" for m in METRICS))
+    regressions = 0
+    for key in sorted(baseline.keys() & current.keys()):
+        cells = []
+        for metric in METRICS:
+            ratio = current[key][metric] / max(baseline[key][metric], 1e-12)
+            marker = " !" if ratio > args.threshold else "  "
+            regressions += ratio > args.threshold
+            cells.append(f"{ratio:16.2f}{marker}")
+        print(f"{key[0]:>24} {key[1]:>6} " + " ".join(cells))
+
+    if regressions:
+        print(f"{regressions} metrics above {args.threshold}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Synthetic inputs for the benchmarks."""
+
+import cadquery as cq
+
+
+def make_solid(holes: int = 20) -> cq.Shape:
+    """A plate with a grid of filleted holes, giving a high face count."""
+    return (
+        cq.Workplane("XY")
+        .box(10 * holes, 10 * holes, 10)
+        .faces(">Z")
+        .workplane()
+        .rarray(10, 10, holes, holes)
+        .hole(4)
+        .edges("%CIRCLE")
+        .fillet(0.5)
+        .val()
+    )
+
+
+def make_freeform_solid(bumps: int = 40) -> cq.Shape:
+    """A spline profile fused with spheres, giving mostly freeform geometry."""
+    profile = [(i, (i * 37 % 11) / 3.0) for i in range(bumps)]
+    body = (
+        cq.Workplane("XY")
+        .spline(profile)
+        .lineTo(bumps, -10)
+        .lineTo(0, -10)
+        .close()
+        .extrude(10)
+        .val()
+    )
+    return body.fuse(
+        *[cq.Solid.makeSphere(1.3, cq.Vector(i + 0.37, -5, 5.1)) for i in range(bumps)]
+    )
+
+
+def make_part(index: int = 0) -> cq.Workplane:
+    """A small distinct part, e.g. for assemblies."""
+    return (
+        cq.Workplane("XY")
+        .box(10, 10, 2 + index * 0.01)
+        .faces(">Z")
+        .workplane()
+        .rarray(3, 3, 3, 3)
+        .hole(1)
+        .edges()
+        .fillet(0.1)
+    )
+
+
+def make_workplane_chain(length: int) -> cq.Workplane:
+    """A chain of workplanes as created by a long fluent script."""
+    wp = cq.Workplane("XY").box(1, 1, 1).tag("base")
+    for i in range(length):
+        wp = wp.newObject([cq.Vector(i, 0, 0)])
+        if i % 1000 == 0:
+            wp = wp.tag(f"step_{i}")
+    return wp
+
+
+def make_sketch(edges: int) -> cq.Sketch:
+    """A sketch with a zig-zag of line segments."""
+    sketch = cq.Sketch()
+    for i in range(edges):
+        sketch = sketch.segment((i, 0), (i + 1, 0.5 * (i % 2)))
+    return sketch
+
+
+def make_assembly_tree(size: int, fanout: int, part=None) -> cq.Assembly:
+    """An assembly tree where every node has up to `fanout` children.
+
+    Use `fanout=1` for a deep chain and a large fanout for a wide tree. If a
+    part is given, every node holds it.
+    """
+    nodes = [cq.Assembly(part, name="node_0")]
+    for i in range(1, size):
+        parent = nodes[(i - 1) // fanout]
+        node = cq.Assembly(part, name=f"node_{i}", loc=cq.Location((1, 0, 0)))
+        node.parent = parent
+        parent.children.append(node)
+        parent.objects[node.name] = node
+        nodes.append(node)
+    return nodes[0]
+
+
+def make_parts_assembly(parts: int) -> cq.Assembly:
+    """An assembly of distinct parts."""
+    assembly = cq.Assembly()
+    for i in range(parts):
+        assembly.add(make_part(i), name=f"part_{i}", loc=cq.Location((i * 12, 0, 0)))
+    return assembly
+
+
+def make_boxes_assembly(parts: int) -> cq.Assembly:
+    """An assembly of many distinct, cheap to build parts."""
+    assembly = cq.Assembly(name="top")
+    for i in range(parts):
+        assembly.add(
+            cq.Solid.makeBox(1, 1, 1 + i * 1e-3),
+            name=f"part_{i}",
+            loc=cq.Location((i * 2, 0, 0)),
+        )
+    return assembly
+
+
+def make_workplane_assembly(parts: int) -> cq.Assembly:
+    """An assembly whose nodes mostly hold distinct Workplane objects."""
+    assembly = cq.Assembly(name="top")
+    for i in range(parts):
+        wp = cq.Workplane("XY").box(1, 1, 1 + i * 1e-3)
+        obj = wp.val() if i % 10 == 0 else wp.faces(">Z").workplane()
+        assembly.add(obj, name=f"part_{i}", loc=cq.Location((i * 2, 0, 0)))
+    return assembly
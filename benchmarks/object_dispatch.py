@@ -0,0 +1,90 @@
+"""Measure the dispatch of Workplane objects and assembly objects: tagged
+payloads against legacy payloads without type tags, which go through the
+untagged unions.
+
+Run with `python benchmarks/object_dispatch.py [objects]`.
+"""
+
+import json
+import sys
+import time
+from typing import Annotated
+
+import cadquery as cq
+from generators import make_solid, make_workplane_assembly
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import SerializationOptions, patch_cadquery
+
+patch_cadquery()
+
+
+def best_time(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def strip_workplane_tags(document: dict):
+    for workplane in document["workplanes"].values():
+        for obj in workplane["objects"]:
+            obj.pop("type", None)
+
+
+def strip_tags(payload: bytes) -> str:
+    document = json.loads(payload)
+    if "instances" in document:
+        for obj in document["instances"]:
+            if obj is not None and obj.get("type") == "Workplane":
+                del obj["type"]
+                strip_workplane_tags(obj)
+    else:
+        strip_workplane_tags(document)
+    return json.dumps(document)
+
+
+def report(name: str, adapter: TypeAdapter, value, size: int):
+    tagged = adapter.dump_json(value)
+    legacy = strip_tags(tagged)
+    print(
+        f"{name:>9} ({size} objects): "
+        f"dump {best_time(lambda: adapter.dump_json(value)) * 1e3:7.1f} ms, "
+        f"validate tagged {best_time(lambda: adapter.validate_json(tagged)) * 1e3:7.1f} ms, "
+        f"legacy {best_time(lambda: adapter.validate_json(legacy)) * 1e3:7.1f} ms"
+    )
+
+
+def main(count: int):
+    faces = make_solid(10).Faces()
+    objects = []
+    for i in range(count):
+        if i % 3 == 0:
+            objects.append(cq.Vector(i, 0, 0))
+        elif i % 3 == 1:
+            objects.append(cq.Location((i, 0, 0)))
+        else:
+            objects.append(faces[i % len(faces)])
+    adapter = TypeAdapter(cq.Workplane)
+
+    for name, wp in (
+        ("mixed", cq.Workplane().newObject(objects)),
+        ("faces", cq.Workplane().newObject(faces)),
+    ):
+        report(name, adapter, wp, len(wp.objects))
+
+    # Assembly nodes that mostly hold workplanes, lazy loading keeps BREP
+    # parsing out of the measurement
+    parts = count // 30
+    report(
+        "assembly",
+        TypeAdapter(Annotated[cq.Assembly, SerializationOptions(lazy=True)]),
+        make_workplane_assembly(parts),
+        parts,
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30_000)
@@ -0,0 +1,52 @@
+"""Compare the encodings of large runs of Vectors and Locations in
+Workplane.objects.
+
+Run with `python benchmarks/packed_arrays.py [points]`.
+"""
+
+import sys
+import time
+from functools import partial
+
+import cadquery as cq
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import patch_cadquery, serialization_options
+
+patch_cadquery()
+
+
+def best_time(func, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(points: int):
+    adapter = TypeAdapter(cq.Workplane)
+    cases = {
+        "vectors": cq.Workplane().newObject(
+            [cq.Vector(i * 0.1, i * 0.2, 0.5) for i in range(points)]
+        ),
+        "locations": cq.Workplane().newObject(
+            [cq.Location((i * 0.1, 0, 0), (0, 0, 1), i % 360) for i in range(points)]
+        ),
+    }
+    for name, wp in cases.items():
+        for encoding in ("objects", "floats", "buffer"):
+            with serialization_options(array_encoding=encoding):
+                payload = adapter.dump_json(wp)
+                dump_time = best_time(partial(adapter.dump_json, wp))
+            validate_time = best_time(partial(adapter.validate_json, payload))
+            print(
+                f"{points} {name:>9} {encoding:>7}: "
+                f"{len(payload) / 1e6:6.2f} MB, dump {dump_time * 1e3:7.1f} ms, "
+                f"validate {validate_time * 1e3:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
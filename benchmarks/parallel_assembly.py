@@ -0,0 +1,68 @@
+"""Compare serial and process-pool serialization of a large assembly.
+
+Run with `python benchmarks/parallel_assembly.py [parts] [workers]`. Reports
+the wall-clock speed-up of the pool over serial processing.
+"""
+
+import sys
+import time
+from functools import partial
+from typing import Annotated
+
+import cadquery as cq
+from generators import make_parts_assembly
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import SerializationOptions, patch_cadquery
+
+patch_cadquery()
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    assembly = make_parts_assembly(parts)
+    print(f"{parts} parts, {workers} workers")
+
+    for compression in (None, "lzma"):
+        serial = TypeAdapter(
+            Annotated[cq.Assembly, SerializationOptions(compression=compression)]
+        )
+        parallel = TypeAdapter(
+            Annotated[
+                cq.Assembly,
+                SerializationOptions(compression=compression, workers=workers),
+            ]
+        )
+        # Start the pool outside of the measurement
+        parallel.validate_json(parallel.dump_json(make_parts_assembly(40)))
+
+        payload = serial.dump_json(assembly)
+        times = {}
+        for name, adapter in (("serial", serial), ("parallel", parallel)):
+            times[name] = (
+                timed(partial(adapter.dump_json, assembly)),
+                timed(partial(adapter.validate_json, payload)),
+            )
+            dump, validate = times[name]
+            print(
+                f"{compression!s:>5} {name:>8}: "
+                f"dump {dump:6.2f} s, validate {validate:6.2f} s"
+            )
+        speedups = [
+            s / p for s, p in zip(times["serial"], times["parallel"], strict=True)
+        ]
+        print(
+            f"{compression!s:>5}  speed-up: "
+            f"dump {speedups[0]:6.2f} x, validate {speedups[1]:6.2f} x"
+        )
+
+
+if __name__ == "__main__":
+    main()
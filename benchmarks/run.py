@@ -0,0 +1,175 @@
+"""Benchmark suite for the core schemas.
+
+Measures dump and validate time, peak Python memory (tracemalloc, so OCC's own
+allocations are not included) and payload size in JSON and Python mode for
+synthetic inputs. Results are written as JSON for comparison with
+`benchmarks/compare.py`.
+
+Run with `python benchmarks/run.py [--scale small|full] [--output results.json]`.
+"""
+
+import argparse
+import json
+import pickle
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from importlib.metadata import version
+
+import cadquery as cq
+from generators import (
+    make_assembly_tree,
+    make_part,
+    make_parts_assembly,
+    make_sketch,
+    make_solid,
+    make_workplane_assembly,
+    make_workplane_chain,
+)
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import patch_cadquery
+
+patch_cadquery()
+
+# (name, type, generator) per scale
+CASES = {
+    "small": [
+        ("solid_300_faces", cq.Shape, lambda: make_solid(5)),
+        ("workplane_chain_1k", cq.Workplane, lambda: make_workplane_chain(1_000)),
+        ("sketch_500_edges", cq.Sketch, lambda: make_sketch(500)),
+        ("assembly_deep_500", cq.Assembly, lambda: make_assembly_tree(500, 1)),
+        ("assembly_wide_500", cq.Assembly, lambda: make_assembly_tree(500, 500)),
+        (
+            "assembly_instances_500",
+            cq.Assembly,
+            lambda: make_assembly_tree(500, 10, make_part()),
+        ),
+        ("assembly_parts_20", cq.Assembly, lambda: make_parts_assembly(20)),
+        (
+            "assembly_workplanes_200",
+            cq.Assembly,
+            lambda: make_workplane_assembly(200),
+        ),
+    ],
+    "full": [
+        ("solid_1200_faces", cq.Shape, lambda: make_solid(20)),
+        ("solid_4800_faces", cq.Shape, lambda: make_solid(40)),
+        ("workplane_chain_10k", cq.Workplane, lambda: make_workplane_chain(10_000)),
+        ("sketch_5k_edges", cq.Sketch, lambda: make_sketch(5_000)),
+        ("assembly_deep_10k", cq.Assembly, lambda: make_assembly_tree(10_000, 1)),
+        ("assembly_wide_10k", cq.Assembly, lambda: make_assembly_tree(10_000, 10_000)),
+        (
+            "assembly_instances_10k",
+            cq.Assembly,
+            lambda: make_assembly_tree(10_000, 10, make_part()),
+        ),
+        ("assembly_parts_500", cq.Assembly, lambda: make_parts_assembly(500)),
+        (
+            "assembly_workplanes_2k",
+            cq.Assembly,
+            lambda: make_workplane_assembly(2_000),
+        ),
+    ],
+}
+
+
+def best_time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(name: str, obj_type, obj, repeat: int) -> list[dict]:
+    adapter = TypeAdapter(obj_type)
+    results = []
+
+    payload = adapter.dump_json(obj)
+    results.append(
+        {
+            "case": name,
+            "mode": "json",
+            "payload_bytes": len(payload),
+            "dump_s": best_time(lambda: adapter.dump_json(obj), repeat),
+            "validate_s": best_time(lambda: adapter.validate_json(payload), repeat),
+            "peak_memory_bytes": peak_memory(
+                lambda: adapter.validate_json(adapter.dump_json(obj))
+            ),
+        }
+    )
+
+    data = adapter.dump_python(obj)
+    results.append(
+        {
+            "case": name,
+            "mode": "python",
+            # Python mode has no wire format, use the pickled size as a proxy
+            "payload_bytes": len(pickle.dumps(data)),
+            "dump_s": best_time(lambda: adapter.dump_python(obj), repeat),
+            "validate_s": best_time(lambda: adapter.validate_python(data), repeat),
+            "peak_memory_bytes": peak_memory(
+                lambda: adapter.validate_python(adapter.dump_python(obj))
+            ),
+        }
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=list(CASES), default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--case", action="append", help="Only run these cases")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for name, obj_type, generator in CASES[args.scale]:
+        if args.case and name not in args.case:
+            continue
+        for result in run_case(name, obj_type, generator(), args.repeat):
+            print(
+                f"{result['case']:>24} {result['mode']:>6}: "
+                f"{result['payload_bytes'] / 1e3:10.1f} kB, "
+                f"dump {result['dump_s'] * 1e3:9.1f} ms, "
+                f"validate {result['validate_s'] * 1e3:9.1f} ms, "
+                f"peak {result['peak_memory_bytes'] / 1e6:8.1f} MB",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cadquery": version("cadquery"),
+            "pydantic_core": version("pydantic-core"),
+            "scale": args.scale,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Measure graph traversal and (de)serialization of long workplane chains and
+large assembly trees.
+
+Run with `python benchmarks/traversal.py [size]`.
+"""
+
+import sys
+import time
+
+import cadquery as cq
+from generators import make_assembly_tree, make_workplane_chain
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import patch_cadquery
+from cadquery_pydantic.assembly import collect_related_assemblies
+from cadquery_pydantic.workplane import collect_related_workplanes
+
+patch_cadquery()
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def report(name: str, root, collect, adapter: TypeAdapter):
+    payload = adapter.dump_json(root)
+    print(
+        f"{name:>28}: collect {timed(lambda: collect(root)) * 1e3:8.1f} ms, "
+        f"dump {timed(lambda: adapter.dump_json(root)) * 1e3:8.1f} ms, "
+        f"validate {timed(lambda: adapter.validate_json(payload)) * 1e3:8.1f} ms"
+    )
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    report(
+        f"workplane chain ({size})",
+        make_workplane_chain(size),
+        collect_related_workplanes,
+        TypeAdapter(cq.Workplane),
+    )
+    for fanout, name in ((1, "deep"), (10, "balanced"), (size, "wide")):
+        report(
+            f"{name} assembly ({size})",
+            make_assembly_tree(size, fanout),
+            collect_related_assemblies,
+            TypeAdapter(cq.Assembly),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -20,15 +20,44 @@ from .geom import (
     boundbox_core_schema,
     location_core_schema,
 )
-from .shapes import shape_core_schema
+from .archive import AssemblyArchive, write_assembly_archive
+from .binary import dump_msgpack, validate_msgpack
+from .blobs import BlobStore, DirectoryBlobStore, MemoryBlobStore
+from .cache import SerializationMemo, ShapeCache
+from .instrumentation import Instrumentation, instrument
+from .mesh import AssemblyMesh, Mesh
+from .options import SerializationOptions, serialization_options
+from .shapes import LazyShape, shape_core_schema
 from .sketch import constraint_core_schema, sketch_core_schema
 from .workplane import workplane_core_schema
 from .assembly import (
     assembly_core_schema,
     color_core_schema,
     constraint_spec_core_schema,
+    load_assembly_subtree,
 )
 
+__all__ = [
+    "AssemblyArchive",
+    "AssemblyMesh",
+    "BlobStore",
+    "DirectoryBlobStore",
+    "Instrumentation",
+    "LazyShape",
+    "MemoryBlobStore",
+    "Mesh",
+    "SerializationMemo",
+    "SerializationOptions",
+    "ShapeCache",
+    "dump_msgpack",
+    "instrument",
+    "load_assembly_subtree",
+    "patch_cadquery",
+    "serialization_options",
+    "validate_msgpack",
+    "write_assembly_archive",
+]
+
 
 def patch_cadquery():
     # Patch geometry classes
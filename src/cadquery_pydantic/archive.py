@@ -0,0 +1,148 @@
+import mmap
+import os
+import struct
+import tempfile
+from typing import TYPE_CHECKING, BinaryIO
+
+from cadquery import Assembly
+from pydantic_core import SchemaSerializer, from_json, to_json
+
+from .assembly import (
+    assembly_core_schema,
+    assembly_validator,
+    find_assembly_paths,
+    select_assembly_subtree,
+)
+from .blobs import BlobStore
+from .options import serialization_options
+
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
+# Magic, index offset and index length
+ARCHIVE_MAGIC = b"CQASSY01"
+ARCHIVE_HEADER = struct.Struct("<8sQQ")
+
+_assembly_serializer = SchemaSerializer(assembly_core_schema)
+
+
+class _ArchiveWriterStore(BlobStore):
+    """Blob store appending blobs to an archive file, recording their offsets."""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.blobs: dict[str, tuple[int, int]] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.blobs
+
+    def get(self, key: str) -> bytes:
+        raise KeyError(key)
+
+    def put(self, key: str, data: bytes):
+        self.blobs[key] = (self.file.tell(), len(data))
+        self.file.write(data)
+
+
+class _ArchiveReaderStore(BlobStore):
+    """Blob store handing out slices of a memory-mapped archive.
+
+    Slices are views of the mapping, the BREP reader copies the data of a blob
+    when the shape is imported.
+    """
+
+    def __init__(self, view: memoryview, blobs: dict[str, list[int]]):
+        self.view = view
+        self.blobs = blobs
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.blobs
+
+    def get(self, key: str) -> memoryview:
+        offset, length = self.blobs[key]
+        return self.view[offset : offset + length]
+
+    def put(self, key: str, data: bytes):
+        raise TypeError("Assembly archives are read-only")
+
+
+def write_assembly_archive(assembly: Assembly, path: str | os.PathLike):
+    """Write an assembly to a single archive file.
+
+    The archive holds the packed BREP blobs followed by an index, which is the
+    serialized assembly with its shapes replaced by blob references. Shapes
+    are stored as binary BREP, compressed according to the active options.
+    The archive is written to a temporary file next to `path` first, so a
+    failed write leaves no partial archive behind.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, 0, 0))
+            store = _ArchiveWriterStore(f)
+            with serialization_options(brep_format="binary", blob_store=store):
+                model = _assembly_serializer.to_python(assembly, mode="json")
+
+            index = to_json({"blobs": store.blobs, "assembly": model})
+            index_offset = f.tell()
+            f.write(index)
+            f.seek(0)
+            f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, index_offset, len(index)))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class AssemblyArchive:
+    """Read access to an archive written by `write_assembly_archive`.
+
+    The file is memory-mapped and only the index is parsed on opening.
+    Loading a node parses the shapes of its subtree only, whose BREP data is
+    read through slices of the mapping.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = ARCHIVE_HEADER.unpack_from(self._mmap)
+        if magic != ARCHIVE_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an assembly archive")
+
+        self._view = memoryview(self._mmap)
+        index = from_json(self._mmap[index_offset : index_offset + index_length])
+        self.model: dict = index["assembly"]
+        self._store = _ArchiveReaderStore(self._view, index["blobs"])
+        self.paths = find_assembly_paths(self.model)
+
+    def __enter__(self) -> "Self":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the archive, shapes must be loaded before closing."""
+        self._view.release()
+        self._mmap.close()
+
+    def names(self) -> list[str]:
+        """Get the name paths of all nodes."""
+        return list(self.paths)
+
+    def load(self, name: str | None = None) -> Assembly:
+        """Load the node with the given name path and its subtree.
+
+        Without a name the complete assembly is loaded. See
+        `select_assembly_subtree` for what is loaded along with a subtree.
+        Shapes are always parsed right away, lazy shapes would read from the
+        mapping after the archive is closed.
+        """
+        value = self.model
+        if name is not None:
+            value = select_assembly_subtree(value, name)
+
+        with serialization_options(blob_store=self._store, lazy=False):
+            return assembly_validator.validate_python(value)
@@ -1,16 +1,36 @@
-from cadquery import Assembly, Color
+import warnings
+from collections.abc import Callable, Iterator
+from cadquery import Assembly, Color, Shape, Workplane
 from cadquery.occ_impl.solver import ConstraintSpec
-from pydantic_core import core_schema
-from .shapes import shape_core_schema
-from .workplane import workplane_core_schema
+from pydantic_core import SchemaValidator, core_schema, from_json
+from .instrumentation import instrumented
+from .parallel import parallel_export, parallel_import
+from .options import get_options
+from .shapes import (
+    SharedGeometry,
+    geometry_ref_schema,
+    load_shared_geometry,
+    resolve_geometry_refs,
+    shape_classes,
+    shape_core_schema,
+    shape_ref_schema,
+)
+from .subshapes import SubshapeIndex, subshape_ref_schema
+from .workplane import (
+    collect_workplane_shapes,
+    serialize_workplane,
+    with_type_tag,
+    workplane_core_schema,
+    workplane_model_schema,
+)
 from .geom import location_core_schema
 
 
-def get_assembly_id(assembly: Assembly | None) -> str | None:
-    """Get a consistent string ID for an assembly instance."""
+def get_assembly_id(assembly: Assembly | None, ids: dict[int, str]) -> str | None:
+    """Get the document ID of an assembly instance."""
     if assembly is None:
         return None
-    return str(id(assembly))
+    return ids[id(assembly)]
 
 
 def extract_id_from_ref(ref: str | None) -> str | None:
@@ -63,6 +83,7 @@ constraint_spec_schema = core_schema.typed_dict_schema(
 )
 
 
+@instrumented("constraint", "validate")
 def validate_constraint_spec(value: dict) -> ConstraintSpec:
     """Validate and construct a ConstraintSpec from a dictionary."""
     return ConstraintSpec(
@@ -74,6 +95,7 @@ def validate_constraint_spec(value: dict) -> ConstraintSpec:
     )
 
 
+@instrumented("constraint", "serialize")
 def serialize_constraint_spec(spec: ConstraintSpec) -> dict:
     """Serialize a ConstraintSpec to a dictionary."""
     return {
@@ -108,6 +130,106 @@ constraint_spec_core_schema = core_schema.json_or_python_schema(
 )
 
 
+# Reference from a constraint argument to a subshape of an assembly object,
+# "shape" is the index of the shape in the values of a workplane object
+constraint_arg_ref_schema = core_schema.typed_dict_schema(
+    {
+        "object": core_schema.typed_dict_field(core_schema.str_schema()),
+        "shape": core_schema.typed_dict_field(
+            core_schema.int_schema(ge=0), required=False
+        ),
+        **{
+            name: field
+            for name, field in subshape_ref_schema["fields"].items()
+            if name != "$ref"
+        },
+    }
+)
+
+# Constraint within an assembly model, arguments are references where possible
+assembly_constraint_schema = core_schema.typed_dict_schema(
+    {
+        **constraint_spec_schema["fields"],
+        "args": core_schema.typed_dict_field(
+            core_schema.tuple_schema(
+                [
+                    core_schema.union_schema(
+                        [
+                            constraint_arg_ref_schema,
+                            geometry_ref_schema,
+                            shape_core_schema,
+                        ]
+                    )
+                ],
+                variadic_item_index=0,
+            )
+        ),
+    }
+)
+
+
+def assembly_objects_index(assembly: Assembly) -> SubshapeIndex:
+    """Index the object shapes that the constraints of an assembly refer to.
+
+    Objects are keyed by their name in `Assembly.objects`, i.e. the name path
+    below the assembly ("sub/part"), and their index among the values of a
+    workplane.
+    """
+    index = SubshapeIndex()
+    stack = [(assembly, assembly.name)]
+    while stack:
+        node, name = stack.pop()
+        if isinstance(node.obj, Shape):
+            index.add((name, None), node.obj)
+        elif isinstance(node.obj, Workplane):
+            for i, val in enumerate(node.obj.vals()):
+                if isinstance(val, Shape):
+                    index.add((name, i), val)
+        stack.extend(
+            (child, child.name if node is assembly else f"{name}/{child.name}")
+            for child in reversed(node.children)
+        )
+    return index
+
+
+def _in_subtree(top: str) -> Callable[[tuple], bool]:
+    """Match the index paths of objects in the subtree of the node `top`."""
+    return lambda path: path[0] == top or path[0].startswith(f"{top}/")
+
+
+def constraint_arg_refs(spec: ConstraintSpec, index: SubshapeIndex) -> dict:
+    """Serialize a constraint, replacing arguments found in objects with references.
+
+    Arguments that are not part of any object are stored as shapes.
+    """
+    args = []
+    for arg, top in zip(spec.args, spec.objects):
+        # Prefer the objects of the constrained node, shapes may be shared
+        found = index.find(arg, _in_subtree(top))
+        if found is not None:
+            (name, shape), fields = found
+            ref = (
+                {"object": name} if shape is None else {"object": name, "shape": shape}
+            )
+            arg = {**ref, **fields}
+        args.append(arg)
+    return {**serialize_constraint_spec(spec), "args": tuple(args)}
+
+
+def resolve_constraint_args(
+    value: dict, index: SubshapeIndex, geometry: SharedGeometry | None
+) -> ConstraintSpec:
+    """Validate a constraint, resolving references to subshapes of objects."""
+    args = tuple(
+        index.get((arg["object"], arg.get("shape")), arg)
+        if isinstance(arg, dict) and "object" in arg
+        else arg
+        for arg in value["args"]
+    )
+    args = tuple(resolve_geometry_refs(list(args), geometry))
+    return validate_constraint_spec({**value, "args": args})
+
+
 # Color schema
 color_schema = core_schema.typed_dict_schema(
     {
@@ -147,8 +269,37 @@ color_core_schema = core_schema.json_or_python_schema(
 )
 
 
-# Schema for assembly objects (Shape, Workplane, or None)
-assembly_object_schema = core_schema.union_schema(
+def get_assembly_object_tag(value) -> str:
+    """Get the tag of an assembly object, serialized or not."""
+    if value is None:
+        return "none"
+    if isinstance(value, dict):
+        tag = value.get("type")
+        if tag in shape_classes or "brep" in value or "blob" in value:
+            return "shape"
+        if tag is not None:
+            return tag
+        if "child" in value:
+            return "geometry"
+        if "$ref" in value:
+            return "ref"
+        return "legacy"
+
+    if isinstance(value, Shape):
+        return "shape"
+    if isinstance(value, Workplane):
+        return "Workplane"
+    return "legacy"
+
+
+# Serialized workplanes are tagged, shapes carry their shape type
+tagged_workplane_core_schema = with_type_tag(
+    workplane_core_schema, "Workplane", serialize_workplane, workplane_model_schema
+)
+
+# Untagged union of the assembly object types, the fallback for payloads
+# written before objects were tagged
+legacy_assembly_object_schema = core_schema.union_schema(
     [
         core_schema.none_schema(),
         shape_core_schema,
@@ -156,6 +307,30 @@ assembly_object_schema = core_schema.union_schema(
     ]
 )
 
+# Schema for assembly objects (Shape, Workplane, or None)
+assembly_object_schema = core_schema.tagged_union_schema(
+    {
+        "none": core_schema.none_schema(),
+        "shape": shape_core_schema,
+        "geometry": geometry_ref_schema,
+        "Workplane": tagged_workplane_core_schema,
+        "legacy": legacy_assembly_object_schema,
+    },
+    discriminator=get_assembly_object_tag,
+)
+
+# Assembly nodes refer to their object in the instance table
+assembly_object_ref_schema = core_schema.tagged_union_schema(
+    {
+        "none": core_schema.none_schema(),
+        "ref": shape_ref_schema,
+        "shape": shape_core_schema,
+        "Workplane": tagged_workplane_core_schema,
+        "legacy": legacy_assembly_object_schema,
+    },
+    discriminator=get_assembly_object_tag,
+)
+
 
 # Base schema for a single assembly
 assembly_schema = core_schema.typed_dict_schema(
@@ -165,7 +340,7 @@ assembly_schema = core_schema.typed_dict_schema(
         "color": core_schema.typed_dict_field(
             core_schema.union_schema([core_schema.none_schema(), color_core_schema])
         ),
-        "obj": core_schema.typed_dict_field(assembly_object_schema),
+        "obj": core_schema.typed_dict_field(assembly_object_ref_schema),
         "parent": core_schema.typed_dict_field(
             core_schema.union_schema(
                 [
@@ -188,6 +363,10 @@ assembly_model_schema = core_schema.typed_dict_schema(
                 {"$ref": core_schema.typed_dict_field(core_schema.str_schema())}
             )
         ),
+        "instances": core_schema.typed_dict_field(
+            core_schema.list_schema(assembly_object_schema), required=False
+        ),
+        "geometry": core_schema.typed_dict_field(shape_core_schema, required=False),
         "assemblies": core_schema.typed_dict_field(
             core_schema.dict_schema(
                 core_schema.str_schema(),
@@ -195,38 +374,65 @@ assembly_model_schema = core_schema.typed_dict_schema(
             )
         ),
         "constraints": core_schema.typed_dict_field(
-            core_schema.list_schema(constraint_spec_core_schema)
+            core_schema.list_schema(
+                core_schema.json_or_python_schema(
+                    json_schema=assembly_constraint_schema,
+                    python_schema=core_schema.union_schema(
+                        [
+                            core_schema.is_instance_schema(ConstraintSpec),
+                            assembly_constraint_schema,
+                        ]
+                    ),
+                )
+            )
         ),
     }
 )
 
 
-def collect_related_assemblies(
-    assembly: Assembly, collected: set[Assembly] | None = None
-) -> set[Assembly]:
-    """Recursively collect all related assemblies through parent and children relationships."""
-    if collected is None:
-        collected = set()
+@instrumented("assembly", "traverse")
+def collect_related_assemblies(assembly: Assembly) -> list[Assembly]:
+    """Collect all assemblies of the tree an assembly belongs to.
+
+    Assemblies are returned in depth-first order starting at the top-most
+    parent, so each one comes after its parent.
+    """
+    top = assembly
+    while top.parent is not None:
+        top = top.parent
 
-    if assembly in collected:
-        return collected
+    # Walk the tree without recursion to support deep nesting
+    collected = []
+    stack = [top]
+    while stack:
+        current = stack.pop()
+        collected.append(current)
+        stack.extend(reversed(current.children))
 
-    collected.add(assembly)
+    return collected
 
-    # Add parent if it exists
-    if assembly.parent is not None:
-        collect_related_assemblies(assembly.parent, collected)
 
-    # Add all children
-    for child in assembly.children:
-        collect_related_assemblies(child, collected)
+def iter_assembly_shapes(value: dict) -> Iterator[Shape]:
+    """Iterate over the shapes a serialized assembly stores as BREP.
 
-    return collected
+    Shapes referenced as subshapes of other shapes are not included, they are
+    never exported.
+    """
+    for obj in value["instances"]:
+        if isinstance(obj, Shape):
+            yield obj
+        elif isinstance(obj, Workplane):
+            yield from collect_workplane_shapes(obj)
+    for spec in value["constraints"]:
+        yield from (arg for arg in spec["args"] if isinstance(arg, Shape))
 
 
+@instrumented("assembly", "validate")
 def validate_assembly(value: dict) -> Assembly:
     """Validate and construct an Assembly from a dictionary."""
     assemblies = {}
+    geometry = load_shared_geometry(value)
+    instances = resolve_geometry_refs(value.get("instances", []), geometry)
 
     # First pass: Create all assembly instances
     for assembly_id, assembly_data in value["assemblies"].items():
@@ -235,6 +441,9 @@ def validate_assembly(value: dict) -> Assembly:
         assembly.name = assembly_data["name"]
         assembly.color = assembly_data["color"]
         assembly.obj = assembly_data["obj"]
+        if isinstance(assembly.obj, dict):
+            # Shared objects are resolved from the instance table
+            assembly.obj = instances[int(extract_id_from_ref(assembly.obj["$ref"]))]
         assembly.parent = None  # Will be set in second pass
         assembly.children = []  # Will be populated in second pass
         assembly.constraints = []  # Will be populated later
@@ -257,40 +466,103 @@ def validate_assembly(value: dict) -> Assembly:
     root_id = extract_id_from_ref(value["root"]["$ref"])
     root = assemblies[root_id]
 
-    # Set up constraints
-    root.constraints = value["constraints"]
+    # Set up constraints, their arguments may refer to subshapes of objects
+    constraints = value["constraints"]
+    if any(isinstance(spec, dict) for spec in constraints):
+        index = assembly_objects_index(root)
+        constraints = [
+            resolve_constraint_args(spec, index, geometry)
+            if isinstance(spec, dict)
+            else spec
+            for spec in constraints
+        ]
+    root.constraints = constraints
 
     return root
 
 
+@instrumented("assembly", "serialize")
 def serialize_assembly(assembly: Assembly) -> dict:
     """Serialize an Assembly to a dictionary."""
-    # Collect all related assemblies
+    # Collect all related assemblies, IDs follow the (deterministic) traversal
+    # order so that equal assemblies serialize to identical output
     all_assemblies = collect_related_assemblies(assembly)
+    ids = {id(a): str(i) for i, a in enumerate(all_assemblies)}
+
+    # Objects are stored once in the instance table, even if reused by many nodes
+    instances = []
+    instance_ids = {}
+
+    def instance_ref(obj) -> dict | None:
+        if obj is None:
+            return None
+        if id(obj) not in instance_ids:
+            instance_ids[id(obj)] = len(instances)
+            instances.append(obj)
+        return {"$ref": f"3/instances/{instance_ids[id(obj)]}"}
 
     # Serialize each assembly
     assemblies = {}
     for a in all_assemblies:
-        assemblies[get_assembly_id(a)] = {
+        assemblies[get_assembly_id(a, ids)] = {
             "loc": a.loc,
             "name": a.name,
             "color": a.color,
-            "obj": a.obj,
-            "parent": {"$ref": f"2/{get_assembly_id(a.parent)}"}
+            "obj": instance_ref(a.obj),
+            "parent": {"$ref": f"2/{get_assembly_id(a.parent, ids)}"}
             if a.parent is not None
             else None,
         }
 
-    return {
-        "root": {"$ref": f"0/assemblies/{get_assembly_id(assembly)}"},
+    # Constraint arguments are stored as references into the objects
+    index = assembly_objects_index(assembly)
+
+    result = {
+        "root": {"$ref": f"0/assemblies/{get_assembly_id(assembly, ids)}"},
+        "instances": instances,
         "assemblies": assemblies,
-        "constraints": assembly.constraints,
+        "constraints": [
+            constraint_arg_refs(spec, index) for spec in assembly.constraints
+        ],
     }
 
+    # Shapes of workplane objects belong to the workplane's own document
+    if get_options().shared_geometry:
+        geometry = SharedGeometry()
+        result["instances"] = [
+            geometry.ref(obj, 2) if isinstance(obj, Shape) else obj for obj in instances
+        ]
+        for spec in result["constraints"]:
+            spec["args"] = tuple(
+                geometry.ref(arg, 4) if isinstance(arg, Shape) else arg
+                for arg in spec["args"]
+            )
+        if geometry.shapes:
+            result["geometry"] = geometry.compound()
+    return result
+
+
+def serialize_assembly_model(
+    assembly: Assembly, serializer: core_schema.SerializerFunctionWrapHandler
+) -> dict:
+    """Serialize an Assembly, encoding its shapes in parallel if enabled."""
+    value = serialize_assembly(assembly)
+    with parallel_export(iter_assembly_shapes(value)):
+        return serializer(value)
+
+
+def prepare_assembly_model(
+    value, validator: core_schema.ValidatorFunctionWrapHandler
+) -> dict:
+    """Validate an assembly model, converting its shapes in parallel if enabled."""
+    return validator(parallel_import(value))
+
 
 assembly_from_json_schema = core_schema.chain_schema(
     [
-        assembly_model_schema,
+        core_schema.no_info_wrap_validator_function(
+            prepare_assembly_model, assembly_model_schema
+        ),
         core_schema.no_info_plain_validator_function(validate_assembly),
     ]
 )
@@ -302,8 +574,127 @@ assembly_core_schema = core_schema.json_or_python_schema(
     python_schema=core_schema.union_schema(
         [core_schema.is_instance_schema(Assembly), assembly_from_json_schema]
     ),
-    serialization=core_schema.plain_serializer_function_ser_schema(
-        serialize_assembly,
-        return_schema=assembly_model_schema,
+    serialization=core_schema.wrap_serializer_function_ser_schema(
+        serialize_assembly_model,
+        schema=assembly_model_schema,
     ),
 )
+
+
+def find_assembly_paths(value: dict) -> dict[str, str]:
+    """Map the name paths (e.g. "top/sub/part") of a serialized assembly to node IDs."""
+    nodes = value["assemblies"]
+    paths_by_id: dict[str, str] = {}
+    for node_id in nodes:
+        # Walk up to the first node with a known path, without recursion
+        chain = []
+        current = node_id
+        while current is not None and current not in paths_by_id:
+            chain.append(current)
+            parent = nodes[current]["parent"]
+            current = extract_id_from_ref(parent["$ref"]) if parent else None
+        prefix = paths_by_id[current] + "/" if current is not None else ""
+        for chain_id in reversed(chain):
+            prefix += nodes[chain_id]["name"]
+            paths_by_id[chain_id] = prefix
+            prefix += "/"
+
+    return {path: node_id for node_id, path in paths_by_id.items()}
+
+
+def select_assembly_subtree(value: dict, path: str) -> dict:
+    """Reduce a serialized assembly to the subtree at a name path.
+
+    The ancestors of the subtree are kept with their location, name and color,
+    but without their objects and other children. Only the instances used by
+    the subtree are kept. Constraints refer to objects by names relative to
+    the top-level assembly, so they are only kept if the path is the top.
+    The shared geometry of the assembly is dropped unless the subtree refers
+    to it, which warns as it is parsed as a whole.
+    """
+    nodes = value["assemblies"]
+    paths = find_assembly_paths(value)
+    if path not in paths:
+        raise KeyError(path)
+    node_id = paths[path]
+
+    children: dict[str, list[str]] = {}
+    for child_id, node in nodes.items():
+        if node["parent"] is not None:
+            parent_id = extract_id_from_ref(node["parent"]["$ref"])
+            children.setdefault(parent_id, []).append(child_id)
+
+    # First pass: Find the subtree and the ancestors
+    subtree = set()
+    stack = [node_id]
+    while stack:
+        current = stack.pop()
+        subtree.add(current)
+        stack.extend(children.get(current, ()))
+
+    ancestors = set()
+    parent = nodes[node_id]["parent"]
+    while parent is not None:
+        parent_id = extract_id_from_ref(parent["$ref"])
+        ancestors.add(parent_id)
+        parent = nodes[parent_id]["parent"]
+
+    # Second pass: Copy the selected nodes, renumbering the instance references
+    instances = value.get("instances", [])
+    kept: dict[int, int] = {}
+    assemblies = {}
+    top_id = node_id
+    for current, node in nodes.items():
+        if current in ancestors:
+            assemblies[current] = {**node, "obj": None}
+            if node["parent"] is None:
+                top_id = current
+        elif current in subtree:
+            node = dict(node)
+            if isinstance(node["obj"], dict) and "$ref" in node["obj"]:
+                index = int(extract_id_from_ref(node["obj"]["$ref"]))
+                kept.setdefault(index, len(kept))
+                node["obj"] = {"$ref": f"3/instances/{kept[index]}"}
+            assemblies[current] = node
+
+    result = {
+        "root": {"$ref": f"0/assemblies/{node_id}"},
+        "instances": [instances[index] for index in kept],
+        "assemblies": assemblies,
+        "constraints": value["constraints"] if top_id == node_id else [],
+    }
+
+    # The shared geometry is a single BREP, kept only if the subtree uses it
+    if "geometry" in value and uses_shared_geometry(result):
+        warnings.warn(
+            f"{path} uses the shared geometry of the assembly, which is parsed "
+            "as a whole to load it",
+            stacklevel=2,
+        )
+        result["geometry"] = value["geometry"]
+    return result
+
+
+def uses_shared_geometry(value: dict) -> bool:
+    """Check whether a serialized assembly refers to its shared geometry."""
+    items = [
+        *value["instances"],
+        *(arg for spec in value["constraints"] for arg in spec["args"]),
+    ]
+    return any(isinstance(item, dict) and "child" in item for item in items)
+
+
+assembly_validator = SchemaValidator(assembly_core_schema)
+
+
+def load_assembly_subtree(value: str | bytes | dict, path: str) -> Assembly:
+    """Validate only the subtree at a name path of a serialized assembly.
+
+    Accepts JSON or an already parsed document. Returns the node at the path,
+    linked to its ancestors (see `select_assembly_subtree`). Shapes outside
+    the subtree are never parsed, unless the subtree uses the shared geometry
+    of the assembly, which warns.
+    """
+    if not isinstance(value, dict):
+        value = from_json(value)
+    return assembly_validator.validate_python(select_assembly_subtree(value, path))
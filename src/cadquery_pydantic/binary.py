@@ -0,0 +1,37 @@
+from functools import lru_cache
+from typing import Any
+
+from pydantic import TypeAdapter
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+@lru_cache(maxsize=64)
+def _get_adapter(tp: Any) -> TypeAdapter:
+    return TypeAdapter(tp)
+
+
+def _require_msgpack():
+    if msgpack is None:
+        raise ImportError("MessagePack serialization requires the msgpack package")
+
+
+def dump_msgpack(value: Any, tp: Any = None) -> bytes:
+    """Serialize a value containing CadQuery objects to MessagePack.
+
+    The value is dumped in Python mode, so binary and compressed BREP payloads
+    are carried as raw bytes instead of base64. `tp` is the type to serialize
+    the value as, by default its own type (e.g. a pydantic model class).
+    """
+    _require_msgpack()
+    adapter = _get_adapter(type(value) if tp is None else tp)
+    return msgpack.packb(adapter.dump_python(value), use_bin_type=True)
+
+
+def validate_msgpack(data: bytes, tp: Any) -> Any:
+    """Validate MessagePack data written by `dump_msgpack` as the given type."""
+    _require_msgpack()
+    return _get_adapter(tp).validate_python(msgpack.unpackb(data, raw=False))
@@ -0,0 +1,97 @@
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+
+
+class BlobStore(ABC):
+    """Content-addressed storage for BREP data kept outside of documents.
+
+    Blobs are keyed by the hex SHA-256 digest of their data, so storing the
+    same data again is a no-op and documents only carry the key.
+    """
+
+    @staticmethod
+    def key(data: bytes) -> str:
+        """Get the content hash of a blob."""
+        return sha256(data).hexdigest()
+
+    def add(self, data: bytes) -> str:
+        """Store a blob unless it is already present and return its key."""
+        key = self.key(data)
+        if key not in self:
+            self.put(key, data)
+        return key
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Get the data of a blob, raises KeyError if it is not stored."""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """Store the data of a blob under its key."""
+
+
+class MemoryBlobStore(BlobStore):
+    """Blob store backed by a dict, e.g. for tests or a single process."""
+
+    def __init__(self):
+        self.blobs: dict[str, bytes] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.blobs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.blobs
+
+    def get(self, key: str) -> bytes:
+        return self.blobs[key]
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self.blobs.setdefault(key, data)
+
+
+class DirectoryBlobStore(BlobStore):
+    """Blob store keeping one file per blob in a local directory.
+
+    Files are spread over subdirectories named after the first two characters
+    of the key. Blobs are written to a temporary file and renamed, so
+    concurrent writers and readers never see partial blobs.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _blob_path(self, key: str) -> Path:
+        if len(key) < 3 or not key.isalnum():
+            raise KeyError(key)
+        return self.path / key[:2] / key
+
+    def __contains__(self, key: str) -> bool:
+        return self._blob_path(key).exists()
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self._blob_path(key).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def put(self, key: str, data: bytes):
+        path = self._blob_path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,199 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock, RLock
+from typing import Any
+from weakref import finalize
+
+from cadquery import Shape
+
+
+def copy_shape(shape: Shape) -> Shape:
+    """Create a new Shape wrapper sharing the underlying TShape.
+
+    The copy has its own TopoDS_Shape handle, so in-place changes such as
+    `move` or setting the label do not affect the original.
+    """
+    return Shape.cast(shape.wrapped.Located(shape.wrapped.Location()))
+
+
+class ShapeCache:
+    """Bounded LRU cache of imported shapes, keyed by a hash of the BREP payload.
+
+    Cached shapes are never handed out directly: the cache keeps a private
+    copy and every lookup returns a new wrapper (see `copy_shape`). Geometry is
+    shared, but the mutable `label` and the location of the returned shapes
+    stay local to the caller. Labels are not part of the key and are applied
+    after the lookup.
+
+    Limits are given as a maximum number of entries and/or a maximum total
+    size in bytes of the cached payloads. `None` disables a limit.
+    """
+
+    def __init__(self, max_entries: int | None = 128, max_bytes: int | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries: OrderedDict[bytes, tuple[Shape, int]] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: bytes) -> bool:
+        # Does not count as a lookup or refresh the entry
+        with self._lock:
+            return key in self._entries
+
+    def touch(self, key: bytes) -> bool:
+        """Mark an entry as recently used, returns whether the key is cached.
+
+        Does not count as a lookup.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def fits(self, entries: int, size: int) -> bool:
+        """Check whether the cache can hold `entries` shapes of `size` bytes."""
+        return (self.max_entries is None or entries <= self.max_entries) and (
+            self.max_bytes is None or size <= self.max_bytes
+        )
+
+    @staticmethod
+    def key(value: dict) -> bytes:
+        """Hash the BREP payload of a serialized shape, ignoring its label."""
+        # Blob keys are content hashes of the data already
+        data = value["brep"] if "brep" in value else value["blob"]
+        digest = blake2b(
+            data.encode("utf-8") if isinstance(data, str) else data, digest_size=16
+        )
+        digest.update(f"{value.get('format')}/{value.get('compression')}".encode())
+        return digest.digest()
+
+    def get(self, key: bytes) -> Shape | None:
+        """Get a copy of a cached shape, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy_shape(entry[0])
+
+    def put(self, key: bytes, shape: Shape, size: int):
+        """Add a shape imported from a payload of `size` bytes."""
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (copy_shape(shape), size)
+            self.size += size
+
+            # Evict least recently used entries until both limits hold
+            while (self.max_entries is not None and len(self) > self.max_entries) or (
+                self.max_bytes is not None and self.size > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class _MemoEntry:
+    __slots__ = ("data", "owners", "wrapped")
+
+    def __init__(self, wrapped, data):
+        self.wrapped = wrapped
+        self.data = data
+        self.owners: set[int] = set()
+
+
+class SerializationMemo:
+    """Memo of exported BREP data, keyed by the underlying OCC shape.
+
+    The memo holds any data derived from a shape, it also serves as the cache
+    of meshes (see the `mesh_cache` option).
+
+    Entries are keyed by the TShape together with location and orientation
+    (and the encoding options), so different wrappers of the same OCC shape
+    share an entry. An entry is evicted once all shapes it was stored or
+    looked up for have been garbage collected.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._buckets: dict[tuple, list[_MemoEntry]] = {}
+        # Reentrant, finalizers may run during garbage collection inside a lookup
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def _find(self, shape: Shape, bucket_key: tuple) -> _MemoEntry | None:
+        for entry in tuple(self._buckets.get(bucket_key, ())):
+            if entry.wrapped.IsEqual(shape.wrapped):
+                return entry
+        return None
+
+    def contains(self, shape: Shape, options_key: tuple) -> bool:
+        """Check whether a shape is memoized, without counting a lookup."""
+        with self._lock:
+            return self._find(shape, (shape.hashCode(), options_key)) is not None
+
+    def get(self, shape: Shape, options_key: tuple) -> Any:
+        """Get the memoized data of a shape, or None if it is not memoized."""
+        bucket_key = (shape.hashCode(), options_key)
+        with self._lock:
+            entry = self._find(shape, bucket_key)
+            if entry is not None:
+                self.hits += 1
+                self._register(shape, bucket_key, entry)
+                return entry.data
+            self.misses += 1
+        return None
+
+    def put(self, shape: Shape, options_key: tuple, data: Any):
+        """Memoize the exported data of a shape."""
+        bucket_key = (shape.hashCode(), options_key)
+        # Keep a handle of its own, the wrapper may be moved in place later
+        entry = _MemoEntry(shape.wrapped.Located(shape.wrapped.Location()), data)
+        with self._lock:
+            self._buckets.setdefault(bucket_key, []).append(entry)
+            self._register(shape, bucket_key, entry)
+
+    def _register(self, shape: Shape, bucket_key: tuple, entry: _MemoEntry):
+        if id(shape) not in entry.owners:
+            entry.owners.add(id(shape))
+            finalize(shape, self._release, id(shape), bucket_key, entry)
+
+    def _release(self, owner: int, bucket_key: tuple, entry: _MemoEntry):
+        with self._lock:
+            entry.owners.discard(owner)
+            if entry.owners:
+                return
+            bucket = [e for e in self._buckets.get(bucket_key, ()) if e is not entry]
+            if bucket:
+                self._buckets[bucket_key] = bucket
+            else:
+                self._buckets.pop(bucket_key, None)
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._buckets.clear()
+            self.hits = 0
+            self.misses = 0
@@ -1,7 +1,18 @@
+import sys
+from array import array
+from base64 import b64decode, b64encode
+from itertools import chain, groupby
+
 from cadquery.occ_impl.geom import Vector, Matrix, Plane, BoundBox, Location
 from pydantic_core import core_schema
 from OCP.Bnd import Bnd_Box
 from OCP.gp import gp_Pnt
+from .options import get_options
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
 
 # Vector schema
 vector_schema = core_schema.typed_dict_schema(
@@ -63,8 +74,8 @@ def validate_matrix(value: list) -> Matrix:
 
 
 def serialize_matrix(matrix: Matrix) -> list:
-    data = matrix.transposed_list()
-    return [data[0:4], data[4:8], data[8:12], data[12:16]]
+    # Row-major, as expected by validate_matrix
+    return [[matrix[row, col] for col in range(4)] for row in range(4)]
 
 
 matrix_from_json_schema = core_schema.chain_schema(
@@ -249,3 +260,159 @@ location_core_schema = core_schema.json_or_python_schema(
         return_schema=location_schema,
     ),
 )
+
+
+# Packed arrays
+class PackedArray:
+    """A run of Vectors or Locations serialized as one flat float64 array."""
+
+    def __init__(self, kind: str, values: list):
+        self.kind = kind
+        self.values = values
+
+
+# Minimum length of a run of Vectors or Locations to be packed
+MIN_PACKED_RUN = 8
+
+# Floats per item and converters of the packable types
+packed_kinds = {
+    "Vector": (3, lambda v: v.toTuple(), lambda f: Vector(*f)),
+    "Location": (
+        6,
+        lambda loc: chain.from_iterable(loc.toTuple()),
+        lambda f: Location(*f),
+    ),
+}
+packed_types = {Vector: "Vector", Location: "Location"}
+
+packed_array_schema = core_schema.typed_dict_schema(
+    {
+        "packed": core_schema.typed_dict_field(
+            core_schema.literal_schema(list(packed_kinds))
+        ),
+        "count": core_schema.typed_dict_field(core_schema.int_schema(ge=0)),
+        # Flat float list, or little-endian float64 buffer (base64 in JSON)
+        "data": core_schema.typed_dict_field(
+            core_schema.union_schema(
+                [
+                    core_schema.list_schema(core_schema.float_schema()),
+                    core_schema.str_schema(),
+                    core_schema.bytes_schema(),
+                ]
+            )
+        ),
+    }
+)
+
+
+def pack_buffer(typecode: str, values) -> bytes:
+    """Pack numbers into a little-endian buffer of an `array` typecode."""
+    data = array(typecode, values)
+    if sys.byteorder == "big":  # pragma: no cover
+        data.byteswap()
+    return data.tobytes()
+
+
+def unpack_buffer(typecode: str, data: bytes) -> array:
+    """Unpack a little-endian buffer of an `array` typecode."""
+    values = array(typecode, data)
+    if sys.byteorder == "big":  # pragma: no cover
+        values.byteswap()
+    return values
+
+
+def _floats_to_buffer(floats: list[float]) -> bytes:
+    if numpy is not None:
+        return numpy.asarray(floats, dtype="<f8").tobytes()
+    return pack_buffer("d", floats)
+
+
+def _buffer_to_rows(data: bytes, width: int) -> list:
+    if numpy is not None:
+        return numpy.frombuffer(data, dtype="<f8").reshape(-1, width).tolist()
+    floats = unpack_buffer("d", data)
+    return [floats[i : i + width] for i in range(0, len(floats), width)]
+
+
+def validate_packed_array(value: dict) -> PackedArray:
+    width, _, from_floats = packed_kinds[value["packed"]]
+    data = value["data"]
+    if isinstance(data, list):
+        rows = [data[i : i + width] for i in range(0, len(data), width)]
+    else:
+        rows = _buffer_to_rows(
+            b64decode(data) if isinstance(data, str) else data, width
+        )
+
+    if len(rows) != value["count"] or (rows and len(rows[-1]) != width):
+        raise ValueError(
+            f"Packed array data does not match {value['count']} {value['packed']}s"
+        )
+    return PackedArray(value["packed"], [from_floats(row) for row in rows])
+
+
+def serialize_packed_array(
+    packed: PackedArray, info: core_schema.SerializationInfo
+) -> dict:
+    _, to_floats, _ = packed_kinds[packed.kind]
+    floats = list(chain.from_iterable(to_floats(value) for value in packed.values))
+    if get_options().array_encoding == "buffer":
+        data = _floats_to_buffer(floats)
+        data = b64encode(data).decode("ascii") if info.mode_is_json() else data
+    else:
+        data = floats
+    return {"packed": packed.kind, "count": len(packed.values), "data": data}
+
+
+def pack_arrays(items: list) -> list:
+    """Replace runs of Vectors or Locations with packed arrays.
+
+    Does nothing unless the `array_encoding` option is "floats" or "buffer".
+    """
+    if get_options().array_encoding == "objects" or len(items) < MIN_PACKED_RUN:
+        return items
+
+    result = []
+    for item_type, run in groupby(items, type):
+        run = list(run)
+        if item_type in packed_types and len(run) >= MIN_PACKED_RUN:
+            result.append(PackedArray(packed_types[item_type], run))
+        else:
+            result.extend(run)
+    return result
+
+
+def unpack_arrays(items: list) -> list:
+    """Expand the packed arrays in a list of validated items."""
+    if not any(isinstance(item, PackedArray) for item in items):
+        return items
+    result = []
+    for item in items:
+        if isinstance(item, PackedArray):
+            result.extend(item.values)
+        else:
+            result.append(item)
+    return result
+
+
+packed_array_from_json_schema = core_schema.chain_schema(
+    [
+        packed_array_schema,
+        core_schema.no_info_plain_validator_function(validate_packed_array),
+    ]
+)
+
+packed_array_core_schema = core_schema.json_or_python_schema(
+    json_schema=packed_array_from_json_schema,
+    python_schema=core_schema.union_schema(
+        [
+            core_schema.is_instance_schema(PackedArray),
+            packed_array_from_json_schema,
+        ]
+    ),
+    serialization=core_schema.plain_serializer_function_ser_schema(
+        serialize_packed_array,
+        info_arg=True,
+        return_schema=packed_array_schema,
+    ),
+)
@@ -0,0 +1,107 @@
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+
+
+@dataclass
+class Counter:
+    """Call count, cumulative time and payload bytes of one operation."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+
+
+class Instrumentation:
+    """Counters of the serialization and validation functions, per schema type.
+
+    Counters are keyed by type ("shape", "sketch", "workplane", "assembly",
+    "constraint") and operation ("serialize", "validate", "traverse"). Times
+    only cover the function itself: nested objects are serialized by pydantic
+    after it returns and validated before it is called. Bytes are counted for
+    BREP payloads only.
+    """
+
+    def __init__(self):
+        self.counters: dict[tuple[str, str], Counter] = {}
+        self._lock = Lock()
+
+    def record(self, kind: str, operation: str, seconds: float, nbytes: int = 0):
+        """Record a call of an operation."""
+        with self._lock:
+            counter = self.counters.get((kind, operation))
+            if counter is None:
+                counter = self.counters[(kind, operation)] = Counter()
+            counter.calls += 1
+            counter.seconds += seconds
+            counter.bytes += nbytes
+
+    def get(self, kind: str, operation: str) -> Counter:
+        """Get the counter of an operation, zero if it was never called."""
+        return self.counters.get((kind, operation), Counter())
+
+    def summary(self) -> dict[str, dict[str, dict]]:
+        """Get all counters as a nested dict of type, operation and counter fields."""
+        result: dict[str, dict[str, dict]] = {}
+        for (kind, operation), counter in sorted(self.counters.items()):
+            result.setdefault(kind, {})[operation] = {
+                "calls": counter.calls,
+                "seconds": counter.seconds,
+                "bytes": counter.bytes,
+            }
+        return result
+
+
+_current_instrumentation: ContextVar[Instrumentation | None] = ContextVar(
+    "cadquery_pydantic_instrumentation", default=None
+)
+
+
+@contextmanager
+def instrument(
+    instrumentation: Instrumentation | None = None,
+) -> Iterator[Instrumentation]:
+    """Record counters for all serialization and validation inside the block.
+
+    Pass an existing `Instrumentation` to accumulate counters across blocks.
+    """
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+
+    token = _current_instrumentation.set(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        _current_instrumentation.reset(token)
+
+
+def instrumented(
+    kind: str, operation: str, measure: Callable[[tuple, object], int] | None = None
+):
+    """Decorate a function to be recorded while instrumentation is active.
+
+    `measure(args, result)` returns the payload bytes of a call. Without
+    active instrumentation the only overhead is a context variable lookup.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            instrumentation = _current_instrumentation.get()
+            if instrumentation is None:
+                return func(*args)
+
+            start = perf_counter()
+            result = func(*args)
+            elapsed = perf_counter() - start
+            nbytes = measure(args, result) if measure is not None else 0
+            instrumentation.record(kind, operation, elapsed, nbytes)
+            return result
+
+        return wrapper
+
+    return decorator
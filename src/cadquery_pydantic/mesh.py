@@ -0,0 +1,356 @@
+from base64 import b64decode, b64encode
+
+from cadquery import Assembly, Color, Location, Matrix, Shape, Workplane
+from OCP.BRep import BRep_Tool
+from OCP.BRepBuilderAPI import BRepBuilderAPI_Copy
+from OCP.BRepLib import BRepLib_ToolTriangulatedShape
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.TopAbs import TopAbs_FACE, TopAbs_REVERSED
+from OCP.TopExp import TopExp_Explorer
+from OCP.TopLoc import TopLoc_Location
+from OCP.TopoDS import TopoDS
+from pydantic_core import core_schema
+
+from .assembly import color_core_schema
+from .geom import matrix_core_schema, pack_buffer, unpack_buffer
+from .instrumentation import instrumented
+from .options import get_options
+
+
+class Mesh:
+    """Triangle mesh of a shape, held in packed little-endian buffers.
+
+    `vertices` and `normals` hold float32 x, y, z triples, one normal per
+    vertex, and `triangles` holds uint32 vertex indices, three per triangle
+    in counter-clockwise order seen from outside the shape.
+    """
+
+    def __init__(self, vertices: bytes, normals: bytes, triangles: bytes):
+        if len(vertices) != len(normals) or len(vertices) % 12 or len(triangles) % 12:
+            raise ValueError("Mesh buffers do not hold complete vertices/triangles")
+        self.vertices = vertices
+        self.normals = normals
+        self.triangles = triangles
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.vertices) // 12
+
+    @property
+    def triangle_count(self) -> int:
+        return len(self.triangles) // 12
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Mesh):
+            return NotImplemented
+        return (self.vertices, self.normals, self.triangles) == (
+            other.vertices,
+            other.normals,
+            other.triangles,
+        )
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source, _handler):
+        return mesh_core_schema
+
+
+@instrumented("mesh", "tessellate", lambda _args, mesh: len(mesh.vertices))
+def tessellate(shape: Shape, tolerance: float, angular_tolerance: float) -> Mesh:
+    """Tessellate the faces of a shape into a single mesh.
+
+    Vertices are not shared between faces, so normals stay sharp at edges.
+    """
+    # Mesh a copy without triangulation, a mesh stored on the shared TShape
+    # would be reused for other tolerances and written by BREP export
+    wrapped = BRepBuilderAPI_Copy(shape.wrapped, False, False).Shape()
+    BRepMesh_IncrementalMesh(wrapped, tolerance, False, angular_tolerance, True)
+
+    vertices: list[float] = []
+    normals: list[float] = []
+    triangles: list[int] = []
+    explorer = TopExp_Explorer(wrapped, TopAbs_FACE)
+    while explorer.More():
+        face = TopoDS.Face_s(explorer.Current())
+        explorer.Next()
+        loc = TopLoc_Location()
+        triangulation = BRep_Tool.Triangulation_s(face, loc)
+        if triangulation is None:
+            continue
+        if not triangulation.HasNormals():
+            BRepLib_ToolTriangulatedShape.ComputeNormals_s(face, triangulation)
+
+        trsf = loc.Transformation()
+        reversed_ = face.Orientation() == TopAbs_REVERSED
+        sign = -1.0 if reversed_ else 1.0
+        offset = len(vertices) // 3 - 1  # Node indices start at 1
+        for i in range(1, triangulation.NbNodes() + 1):
+            point = triangulation.Node(i).Transformed(trsf)
+            normal = triangulation.Normal(i).Transformed(trsf)
+            vertices += (point.X(), point.Y(), point.Z())
+            normals += (sign * normal.X(), sign * normal.Y(), sign * normal.Z())
+        for i in range(1, triangulation.NbTriangles() + 1):
+            a, b, c = triangulation.Triangle(i).Get()
+            if reversed_:
+                b, c = c, b
+            triangles += (a + offset, b + offset, c + offset)
+
+    return Mesh(
+        pack_buffer("f", vertices),
+        pack_buffer("f", normals),
+        pack_buffer("I", triangles),
+    )
+
+
+def mesh_shape(shape: Shape) -> Mesh:
+    """Get the mesh of a shape with the tolerances of the active options.
+
+    Meshes are looked up in and added to the `mesh_cache` memo if one is set.
+    """
+    options = get_options()
+    options_key = ("mesh", options.mesh_tolerance, options.mesh_angular_tolerance)
+    cache = options.mesh_cache
+    if cache is not None:
+        mesh = cache.get(shape, options_key)
+        if mesh is not None:
+            return mesh
+
+    mesh = tessellate(shape, options.mesh_tolerance, options.mesh_angular_tolerance)
+    if cache is not None:
+        cache.put(shape, options_key, mesh)
+    return mesh
+
+
+def merge_meshes(meshes: list[Mesh]) -> Mesh:
+    """Merge meshes into one, offsetting the vertex indices of each."""
+    if len(meshes) == 1:
+        return meshes[0]
+
+    triangles: list[int] = []
+    offset = 0
+    for mesh in meshes:
+        triangles += (index + offset for index in unpack_buffer("I", mesh.triangles))
+        offset += mesh.vertex_count
+    return Mesh(
+        b"".join(mesh.vertices for mesh in meshes),
+        b"".join(mesh.normals for mesh in meshes),
+        pack_buffer("I", triangles),
+    )
+
+
+def _buffer_schema() -> core_schema.TypedDictField:
+    # Raw bytes in Python mode, base64 encoded in JSON
+    return core_schema.typed_dict_field(
+        core_schema.union_schema([core_schema.str_schema(), core_schema.bytes_schema()])
+    )
+
+
+mesh_schema = core_schema.typed_dict_schema(
+    {
+        "vertex_count": core_schema.typed_dict_field(core_schema.int_schema(ge=0)),
+        "triangle_count": core_schema.typed_dict_field(core_schema.int_schema(ge=0)),
+        "vertices": _buffer_schema(),
+        "normals": _buffer_schema(),
+        "triangles": _buffer_schema(),
+    }
+)
+
+
+def validate_mesh(value: dict) -> Mesh:
+    """Validate and construct a Mesh from a dictionary."""
+    buffers = [
+        b64decode(data) if isinstance(data, str) else data
+        for data in (value["vertices"], value["normals"], value["triangles"])
+    ]
+    mesh = Mesh(*buffers)
+    if (mesh.vertex_count, mesh.triangle_count) != (
+        value["vertex_count"],
+        value["triangle_count"],
+    ):
+        raise ValueError("Mesh buffers do not match the vertex and triangle counts")
+    return mesh
+
+
+def serialize_mesh(mesh: Mesh, info: core_schema.SerializationInfo) -> dict:
+    """Serialize a Mesh to a dictionary."""
+    if info.mode_is_json():
+        buffers = [
+            b64encode(data).decode("ascii")
+            for data in (mesh.vertices, mesh.normals, mesh.triangles)
+        ]
+    else:
+        buffers = [mesh.vertices, mesh.normals, mesh.triangles]
+    return {
+        "vertex_count": mesh.vertex_count,
+        "triangle_count": mesh.triangle_count,
+        "vertices": buffers[0],
+        "normals": buffers[1],
+        "triangles": buffers[2],
+    }
+
+
+mesh_from_json_schema = core_schema.chain_schema(
+    [mesh_schema, core_schema.no_info_plain_validator_function(validate_mesh)]
+)
+
+# Mesh schema, Python values may also be shapes which are tessellated
+mesh_core_schema = core_schema.json_or_python_schema(
+    json_schema=mesh_from_json_schema,
+    python_schema=core_schema.union_schema(
+        [
+            core_schema.is_instance_schema(Mesh),
+            core_schema.chain_schema(
+                [
+                    core_schema.is_instance_schema(Shape),
+                    core_schema.no_info_plain_validator_function(mesh_shape),
+                ]
+            ),
+            mesh_from_json_schema,
+        ]
+    ),
+    serialization=core_schema.plain_serializer_function_ser_schema(
+        serialize_mesh, info_arg=True, return_schema=mesh_schema
+    ),
+)
+
+
+# Assembly meshes
+class MeshPart:
+    """A node of a meshed assembly, placing one of its meshes."""
+
+    def __init__(self, name: str, mesh: int, transform: Matrix, color: Color | None):
+        self.name = name
+        self.mesh = mesh
+        self.transform = transform
+        self.color = color
+
+
+class AssemblyMesh:
+    """Meshes of the shapes of an assembly and the parts placing them.
+
+    Each distinct object of the assembly is meshed once, parts refer to their
+    mesh by index and carry the name path, world transform and (inherited)
+    color of their node.
+    """
+
+    def __init__(self, meshes: list[Mesh], parts: list[MeshPart]):
+        self.meshes = meshes
+        self.parts = parts
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source, _handler):
+        return assembly_mesh_core_schema
+
+
+@instrumented("mesh", "assembly")
+def mesh_assembly(assembly: Assembly) -> AssemblyMesh:
+    """Mesh an assembly and its subtree with the active options."""
+    meshes: list[Mesh] = []
+    mesh_ids: dict[int, int] = {}
+    parts = []
+
+    # Walk the tree without recursion to support deep nesting
+    stack: list[tuple[Assembly, str, Location, Color | None]] = [
+        (assembly, assembly.name, assembly.loc, assembly.color)
+    ]
+    while stack:
+        node, name, loc, color = stack.pop()
+        if node.obj is not None:
+            if id(node.obj) not in mesh_ids:
+                # Shapes of a workplane are meshed (and cached) one by one
+                if isinstance(node.obj, Workplane):
+                    mesh = merge_meshes(
+                        [mesh_shape(s) for s in node.obj.vals() if isinstance(s, Shape)]
+                    )
+                else:
+                    mesh = mesh_shape(node.obj)
+                mesh_ids[id(node.obj)] = len(meshes)
+                meshes.append(mesh)
+            transform = Matrix(loc.wrapped.Transformation())
+            parts.append(MeshPart(name, mesh_ids[id(node.obj)], transform, color))
+
+        stack.extend(
+            (child, f"{name}/{child.name}", loc * child.loc, child.color or color)
+            for child in reversed(node.children)
+        )
+
+    return AssemblyMesh(meshes, parts)
+
+
+mesh_part_schema = core_schema.typed_dict_schema(
+    {
+        "name": core_schema.typed_dict_field(core_schema.str_schema()),
+        "mesh": core_schema.typed_dict_field(core_schema.int_schema(ge=0)),
+        "transform": core_schema.typed_dict_field(matrix_core_schema),
+        "color": core_schema.typed_dict_field(
+            core_schema.union_schema([core_schema.none_schema(), color_core_schema])
+        ),
+    }
+)
+
+assembly_mesh_schema = core_schema.typed_dict_schema(
+    {
+        "meshes": core_schema.typed_dict_field(
+            core_schema.list_schema(mesh_core_schema)
+        ),
+        "parts": core_schema.typed_dict_field(
+            core_schema.list_schema(mesh_part_schema)
+        ),
+    }
+)
+
+
+def validate_assembly_mesh(value: dict) -> AssemblyMesh:
+    """Validate and construct an AssemblyMesh from a dictionary."""
+    meshes = value["meshes"]
+    parts = []
+    for part in value["parts"]:
+        if part["mesh"] >= len(meshes):
+            raise ValueError(f"Part {part['name']} refers to missing mesh")
+        parts.append(
+            MeshPart(part["name"], part["mesh"], part["transform"], part["color"])
+        )
+    return AssemblyMesh(meshes, parts)
+
+
+def serialize_assembly_mesh(value: AssemblyMesh) -> dict:
+    """Serialize an AssemblyMesh to a dictionary."""
+    return {
+        "meshes": value.meshes,
+        "parts": [
+            {
+                "name": part.name,
+                "mesh": part.mesh,
+                "transform": part.transform,
+                "color": part.color,
+            }
+            for part in value.parts
+        ],
+    }
+
+
+assembly_mesh_from_json_schema = core_schema.chain_schema(
+    [
+        assembly_mesh_schema,
+        core_schema.no_info_plain_validator_function(validate_assembly_mesh),
+    ]
+)
+
+# Assembly mesh schema, Python values may also be assemblies which are meshed
+assembly_mesh_core_schema = core_schema.json_or_python_schema(
+    json_schema=assembly_mesh_from_json_schema,
+    python_schema=core_schema.union_schema(
+        [
+            core_schema.is_instance_schema(AssemblyMesh),
+            core_schema.chain_schema(
+                [
+                    core_schema.is_instance_schema(Assembly),
+                    core_schema.no_info_plain_validator_function(mesh_assembly),
+                ]
+            ),
+            assembly_mesh_from_json_schema,
+        ]
+    ),
+    serialization=core_schema.plain_serializer_function_ser_schema(
+        serialize_assembly_mesh, return_schema=assembly_mesh_schema
+    ),
+)
@@ -0,0 +1,106 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Literal
+
+from pydantic_core import core_schema
+
+if TYPE_CHECKING:
+    from .blobs import BlobStore
+    from .cache import SerializationMemo, ShapeCache
+
+BrepFormat = Literal["text", "binary"]
+ArrayEncoding = Literal["objects", "floats", "buffer"]
+Compression = Literal["zlib", "lzma", "zstd"]
+
+
+@dataclass(frozen=True)
+class SerializationOptions:
+    """Options controlling how CadQuery objects are serialized.
+
+    Options can be activated for a block of code with `serialization_options`
+    or attached to a type, e.g. `Annotated[cq.Workplane, SerializationOptions(...)]`,
+    which makes them apply to every dump and validation through that type.
+    """
+
+    # "text" is the human-readable BREP format, "binary" uses OCC's BinTools
+    brep_format: BrepFormat = "text"
+    # Compression codec for BREP payloads, None stores them uncompressed
+    compression: Compression | None = None
+    # Codec specific level, None uses the codec's default
+    compression_level: int | None = None
+    # Cache of imported shapes used during validation, None disables caching
+    shape_cache: "ShapeCache | None" = None
+    # Memo of exported shapes used during serialization, None disables it
+    serialization_memo: "SerializationMemo | None" = None
+    # Validate shapes as LazyShape, deferring BREP parsing until first use
+    lazy: bool = False
+    # Process pool size for assembly shapes, None processes them serially
+    workers: int | None = None
+    # Minimum number of shapes for which the process pool is used
+    parallel_threshold: int = 32
+    # Store BREP data in this blob store and only write its hash into documents
+    blob_store: "BlobStore | None" = None
+    # Runs of Vectors/Locations as "objects", a flat "floats" array or a float64 "buffer"
+    array_encoding: ArrayEncoding = "objects"
+    # Linear and angular (radians) deflection of meshes created from shapes
+    mesh_tolerance: float = 0.1
+    mesh_angular_tolerance: float = 0.1
+    # Memo of meshes created from shapes, None tessellates on every use
+    mesh_cache: "SerializationMemo | None" = None
+    # Export the shapes of a document as one compound, fields refer to its children
+    shared_geometry: bool = False
+
+    def __get_pydantic_core_schema__(self, source, handler):
+        schema = handler(source)
+
+        def validate(value, validator):
+            with serialization_options(self):
+                return validator(value)
+
+        def serialize(value, serializer, _info):
+            with serialization_options(self):
+                return serializer(value)
+
+        return core_schema.no_info_wrap_validator_function(
+            validate,
+            schema,
+            serialization=core_schema.wrap_serializer_function_ser_schema(
+                serialize, schema=schema, info_arg=True
+            ),
+        )
+
+
+# Options are frozen, so the defaults can be shared by all contexts
+_default_options = SerializationOptions()
+
+_current_options: ContextVar[SerializationOptions] = ContextVar(
+    "cadquery_pydantic_options", default=_default_options
+)
+
+
+def get_options() -> SerializationOptions:
+    """Get the currently active serialization options."""
+    return _current_options.get()
+
+
+@contextmanager
+def serialization_options(
+    options: SerializationOptions | None = None, **changes
+) -> Iterator[SerializationOptions]:
+    """Activate serialization options for the duration of the block.
+
+    Either pass a complete `SerializationOptions` instance or keyword arguments
+    overriding fields of the currently active options.
+    """
+    if options is None:
+        options = get_options()
+    if changes:
+        options = replace(options, **changes)
+
+    token = _current_options.set(options)
+    try:
+        yield options
+    finally:
+        _current_options.reset(token)
@@ -0,0 +1,192 @@
+import atexit
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from cadquery import Shape
+
+from .cache import SerializationMemo
+from .options import SerializationOptions, get_options, serialization_options
+from .shapes import LazyShape, decode_brep, encode_brep, export_brep, import_brep
+
+_executors: dict[int, ProcessPoolExecutor] = {}
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    """Get a process pool with the given number of workers, reused across calls."""
+    if workers not in _executors:
+        _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _executors[workers]
+
+
+@atexit.register
+def shutdown_executors():
+    """Shut down all process pools."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _encode_worker(args: tuple) -> bytes:
+    data, brep_format, compression, compression_level = args
+    options = SerializationOptions(
+        brep_format=brep_format,
+        compression=compression,
+        compression_level=compression_level,
+    )
+    return encode_brep(import_brep(data, "binary"), options)
+
+
+def _decode_worker(value: dict) -> bytes:
+    shape = import_brep(decode_brep(value), value.get("format", "text"))
+    return export_brep(shape, "binary")
+
+
+def _chunksize(count: int, workers: int) -> int:
+    return max(1, count // (workers * 4))
+
+
+@contextmanager
+def parallel_export(shapes: Iterable[Shape]) -> Iterator[None]:
+    """Encode shapes in a process pool for the serialization inside the block.
+
+    The parent process only exports binary BREP, the workers convert it to the
+    requested format and compression. Results are handed to `serialize_shape`
+    through a serialization memo. Shapes already in the `serialization_memo`
+    are not sent to the pool. Does nothing unless the `workers` option is set
+    and at least `parallel_threshold` shapes need encoding.
+    """
+    options = get_options()
+    if (
+        options.workers is None
+        or (options.brep_format == "binary" and options.compression is None)
+        or options.shared_geometry
+    ):
+        # Binary BREP without compression leaves nothing to offload, shared
+        # geometry is exported as a single compound
+        yield
+        return
+
+    # Untouched lazy shapes pass their payload through anyway, memoized shapes
+    # are not exported again
+    options_key = (options.brep_format, options.compression, options.compression_level)
+    memoized = options.serialization_memo
+    pending = {
+        id(shape): shape
+        for shape in shapes
+        if not (isinstance(shape, LazyShape) and not shape.loaded)
+        and not (memoized is not None and memoized.contains(shape, options_key))
+    }
+    if len(pending) < options.parallel_threshold:
+        yield
+        return
+
+    memo = memoized if memoized is not None else SerializationMemo()
+    shapes = list(pending.values())
+    tasks = [
+        (
+            export_brep(shape, "binary"),
+            options.brep_format,
+            options.compression,
+            options.compression_level,
+        )
+        for shape in shapes
+    ]
+    executor = get_executor(options.workers)
+    results = executor.map(
+        _encode_worker, tasks, chunksize=_chunksize(len(tasks), options.workers)
+    )
+    for shape, data in zip(shapes, results):
+        memo.put(shape, options_key, data)
+
+    if options.serialization_memo is memo:
+        context = nullcontext()
+    else:
+        context = serialization_options(serialization_memo=memo)
+    with context:
+        yield
+
+
+def collect_payloads(value) -> list[dict]:
+    """Collect all serialized shapes in a raw document."""
+    payloads = []
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if "brep" in item:
+                payloads.append(item)
+            else:
+                stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return payloads
+
+
+def parallel_import(value: dict) -> dict:
+    """Parse the shape payloads of a raw document in a process pool.
+
+    The workers parse the payloads and send back binary BREP. Payloads in the
+    `shape_cache` are skipped. If the cache can hold all shapes of the
+    document, the parent process imports the results into the cache under
+    the keys of their original payloads and the document is returned
+    unchanged. Otherwise, e.g. without a cache, a copy of the document with
+    converted payloads is returned, so no result is evicted before use.
+
+    Does nothing for lazy validation, which parses shapes on first use, or
+    unless the `workers` option is set and at least `parallel_threshold`
+    payloads need parsing. Partial loading selects the subtree before the
+    document gets here, so only its payloads are parsed.
+    """
+    options = get_options()
+    if options.workers is None or options.lazy or not isinstance(value, dict):
+        return value
+
+    cache = options.shape_cache
+    # Payloads with the same data are parsed once
+    payloads: dict[int | bytes, list[dict]] = {}
+    sizes: dict[bytes, int] = {}
+    for payload in collect_payloads(value):
+        if cache is None:
+            key = id(payload)
+        else:
+            key = cache.key(payload)
+            sizes[key] = len(payload["brep"])
+            if cache.touch(key):
+                continue
+        if payload.get("format") == "binary" and payload.get("compression") is None:
+            continue
+        payloads.setdefault(key, []).append(payload)
+    if len(payloads) < options.parallel_threshold:
+        return value
+
+    executor = get_executor(options.workers)
+    results = executor.map(
+        _decode_worker,
+        [same[0] for same in payloads.values()],
+        chunksize=_chunksize(len(payloads), options.workers),
+    )
+    if cache is not None and cache.fits(len(sizes), sum(sizes.values())):
+        for (key, same), data in zip(payloads.items(), results):
+            cache.put(key, import_brep(data, "binary"), len(same[0]["brep"]))
+        return value
+
+    converted = {}
+    for same, data in zip(payloads.values(), results):
+        for payload in same:
+            converted[id(payload)] = {
+                **{k: v for k, v in payload.items() if k != "compression"},
+                "brep": data,
+                "format": "binary",
+            }
+    return _replace_payloads(value, converted)
+
+
+def _replace_payloads(value, converted: dict[int, dict]):
+    if isinstance(value, dict):
+        if id(value) in converted:
+            return converted[id(value)]
+        return {k: _replace_payloads(v, converted) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_payloads(item, converted) for item in value]
+    return value
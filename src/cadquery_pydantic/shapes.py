@@ -1,41 +1,444 @@
-from cadquery import Shape
+import lzma
+import zlib
+from base64 import b64decode, b64encode
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+from cadquery import (
+    Compound,
+    Edge,
+    Face,
+    Shape,
+    Shell,
+    Solid,
+    Vertex,
+    Wire,
+)
+from cadquery.occ_impl.shapes import CompSolid
 from pydantic_core import core_schema
 from io import BytesIO
+from OCP.BinTools import BinTools
+from OCP.TopoDS import TopoDS_Iterator, TopoDS_Shape
+from .instrumentation import instrumented
+from .options import SerializationOptions, get_options
+
+if TYPE_CHECKING:
+    from .blobs import BlobStore
+    from .cache import ShapeCache
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+def _zstd_compress(data: bytes, level: int | None) -> bytes:
+    if level is None:
+        return zstandard.ZstdCompressor().compress(data)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# A codec is a pair of compress(data, level) and decompress(data)
+Codec = tuple[Callable[[bytes, int | None], bytes], Callable[[bytes], bytes]]
+
+compression_codecs: dict[str, Codec] = {
+    "zlib": (
+        lambda data, level: zlib.compress(data, -1 if level is None else level),
+        zlib.decompress,
+    ),
+    "lzma": (
+        lambda data, level: lzma.compress(data, preset=level),
+        lzma.decompress,
+    ),
+}
+if zstandard is not None:
+    compression_codecs["zstd"] = (_zstd_compress, _zstd_decompress)
+
+
+def get_codec(compression: str) -> Codec:
+    """Get the compress/decompress pair of a compression codec."""
+    if compression not in compression_codecs:
+        if compression == "zstd":
+            raise ValueError("zstd compression requires the zstandard package")
+        raise ValueError(f"Unknown compression codec {compression!r}")
+    return compression_codecs[compression]
+
 
 # Shape schema
 shape_schema = core_schema.typed_dict_schema(
     {
-        "brep": core_schema.typed_dict_field(core_schema.str_schema()),
+        "brep": core_schema.typed_dict_field(
+            core_schema.union_schema(
+                [core_schema.str_schema(), core_schema.bytes_schema()]
+            ),
+            required=False,
+        ),
+        # Content hash of BREP data kept in a blob store instead of "brep"
+        "blob": core_schema.typed_dict_field(core_schema.str_schema(), required=False),
+        "format": core_schema.typed_dict_field(
+            core_schema.literal_schema(["text", "binary"]), required=False
+        ),
+        "compression": core_schema.typed_dict_field(
+            core_schema.str_schema(), required=False
+        ),
+        "type": core_schema.typed_dict_field(core_schema.str_schema(), required=False),
         "label": core_schema.typed_dict_field(core_schema.str_schema(), required=False),
     }
 )
 
 
-def validate_shape(value: dict) -> Shape:
-    if "brep" not in value:
-        raise ValueError("Shape must contain brep")
+def export_brep(shape: Shape, brep_format: str = "text") -> bytes:
+    """Export a shape to BREP data in the given format."""
+    brep_stream = BytesIO()
+    if brep_format == "binary":
+        BinTools.Write_s(shape.wrapped, brep_stream)
+    else:
+        shape.exportBrep(brep_stream)
+    return brep_stream.getvalue()
+
+
+def import_brep(data: bytes, brep_format: str = "text") -> Shape:
+    """Import a shape from BREP data in the given format."""
+    brep_stream = BytesIO(data)
+    if brep_format == "binary":
+        wrapped = TopoDS_Shape()
+        BinTools.Read_s(wrapped, brep_stream)
+        return Shape.cast(wrapped)
+    return Shape.importBrep(brep_stream)
+
+
+def payload_data(value: dict, store: "BlobStore | None" = None) -> bytes:
+    """Get the BREP data of a serialized shape, still compressed.
+
+    Blob payloads are read from the given store.
+    """
+    if "blob" in value and "brep" not in value:
+        if store is None:
+            raise ValueError(
+                f"Shape refers to blob {value['blob']}, but no blob store is set"
+            )
+        try:
+            return store.get(value["blob"])
+        except KeyError:
+            raise ValueError(f"Blob {value['blob']} not found in blob store") from None
+
+    data = value["brep"]
+    if isinstance(data, str):
+        # Binary and compressed data is base64 encoded in JSON
+        if value.get("format") == "binary" or value.get("compression") is not None:
+            return b64decode(data)
+        return data.encode("utf-8")
+    return data
+
+
+def decode_brep(value: dict, store: "BlobStore | None" = None) -> bytes:
+    """Get the raw BREP data of a serialized shape."""
+    data = payload_data(value, store)
+    if value.get("compression") is not None:
+        _, decompress = get_codec(value["compression"])
+        data = decompress(data)
+    return data
+
+
+def load_shape(
+    value: dict,
+    cache: "ShapeCache | None" = None,
+    store: "BlobStore | None" = None,
+) -> Shape:
+    """Import the shape of a serialized shape, ignoring its label."""
+    if cache is not None:
+        key = cache.key(value)
+        shape = cache.get(key)
+        if shape is not None:
+            return shape
 
     # Create a new shape from the BREP data
-    brep_stream = BytesIO(value["brep"].encode("utf-8"))
-    shape = Shape.importBrep(brep_stream)
+    data = decode_brep(value, store)
+    shape = import_brep(data, value.get("format", "text"))
+    if cache is not None:
+        # Blobs are not part of the document, count their BREP data instead
+        cache.put(key, shape, len(value["brep"]) if "brep" in value else len(data))
+    return shape
+
+
+class LazyShape(Shape):
+    """A shape that defers parsing its BREP payload until first use.
+
+    The payload is imported on the first access of `wrapped`, i.e. on the
+    first geometric operation. The label is available right away. Serializing
+    a lazy shape that was never loaded passes the original payload through.
+
+    CadQuery builds the results of e.g. `copy()` or `moved()` with
+    `self.__class__(wrapped)`, a shape created from a `TopoDS_Shape` is loaded
+    and behaves like a regular shape.
+    """
+
+    def __init__(
+        self,
+        value: dict | TopoDS_Shape,
+        cache: "ShapeCache | None" = None,
+        store: "BlobStore | None" = None,
+    ):
+        self._cache = cache
+        self._store = store
+        self._wrapped = None
+        if isinstance(value, TopoDS_Shape):
+            self.payload: dict | None = None
+            super().__init__(value)
+            return
+
+        self.payload = value
+        self.forConstruction = False
+        self.label = value.get("label", "")
+
+    @property
+    def loaded(self) -> bool:
+        return self._wrapped is not None
+
+    @property
+    def wrapped(self):
+        if self._wrapped is None:
+            self._wrapped = load_shape(self.payload, self._cache, self._store).wrapped
+        return self._wrapped
+
+    @wrapped.setter
+    def wrapped(self, value):
+        self._wrapped = value
+
+    def ShapeType(self) -> str:
+        if not self.loaded and "type" in self.payload:
+            return self.payload["type"]
+        return super().ShapeType()
+
+    def reencode(self, options: SerializationOptions) -> bytes | None:
+        """Get the payload data for the given options without a BREP export.
+
+        Returns None if the shape was loaded or the BREP format differs.
+        """
+        if self.loaded or self.payload.get("format", "text") != options.brep_format:
+            return None
+        if self.payload.get("compression") == options.compression:
+            return payload_data(self.payload, self._store)
+
+        data = decode_brep(self.payload, self._store)
+        if options.compression is not None:
+            compress, _ = get_codec(options.compression)
+            data = compress(data, options.compression_level)
+        return data
+
+    def reuse_blob(self, options: SerializationOptions) -> str | None:
+        """Get the blob key of the payload if it can be written as is.
+
+        Returns None unless the payload is a blob of the active store with the
+        requested format and compression, and the shape was not loaded.
+        """
+        if (
+            self.loaded
+            or "blob" not in self.payload
+            or options.blob_store is not self._store
+            or self.payload.get("format", "text") != options.brep_format
+            or self.payload.get("compression") != options.compression
+        ):
+            return None
+        return self.payload["blob"]
+
+
+# Concrete shape classes by the names ShapeType() returns
+shape_classes: dict[str, type[Shape]] = {
+    cls.__name__: cls
+    for cls in (Vertex, Edge, Wire, Face, Shell, Solid, CompSolid, Compound)
+}
+
+# Lazy shapes subclass the concrete shape type given in the payload, so that
+# isinstance checks (e.g. in Workplane.findSolid) work without loading them
+lazy_shape_types: dict[str, type[LazyShape]] = {
+    name: type(f"Lazy{name}", (LazyShape, cls), {})
+    for name, cls in shape_classes.items()
+}
+
+
+@instrumented("shape", "validate", lambda args, _: len(args[0].get("brep", "")))
+def validate_shape(value: dict) -> Shape:
+    if "brep" not in value and "blob" not in value:
+        raise ValueError("Shape must contain brep or blob")
+
+    options = get_options()
+    if options.lazy:
+        return lazy_shape_types.get(value.get("type"), LazyShape)(
+            value, options.shape_cache, options.blob_store
+        )
+
+    shape = load_shape(value, options.shape_cache, options.blob_store)
     if "label" in value:
         shape.label = value["label"]
     return shape
 
 
-def serialize_shape(shape: Shape) -> dict:
-    # Use BytesIO to capture the BREP output
-    brep_stream = BytesIO()
-    shape.exportBrep(brep_stream)
-    brep_data = brep_stream.getvalue().decode("utf-8")
-    brep_stream.close()
+def encode_brep(shape: Shape, options: SerializationOptions) -> bytes:
+    """Export a shape to BREP data, compressed according to the options."""
+    data = export_brep(shape, options.brep_format)
+    if options.compression is not None:
+        compress, _ = get_codec(options.compression)
+        data = compress(data, options.compression_level)
+    return data
 
-    result = {"brep": brep_data}
+
+@instrumented("shape", "serialize", lambda _, result: len(result.get("brep", "")))
+def serialize_shape(shape: Shape, info: core_schema.SerializationInfo) -> dict:
+    options = get_options()
+
+    data = blob = None
+    if isinstance(shape, LazyShape):
+        # Untouched lazy shapes keep their original payload
+        blob = shape.reuse_blob(options)
+        if blob is None:
+            data = shape.reencode(options)
+
+    memo = options.serialization_memo
+    if blob is None and data is None:
+        if memo is None:
+            data = encode_brep(shape, options)
+        else:
+            options_key = (
+                options.brep_format,
+                options.compression,
+                options.compression_level,
+            )
+            data = memo.get(shape, options_key)
+            if data is None:
+                data = encode_brep(shape, options)
+                memo.put(shape, options_key, data)
+
+    if options.blob_store is not None:
+        # Only the content hash goes into the document
+        result = {"blob": blob if blob is not None else options.blob_store.add(data)}
+    elif options.brep_format == "binary" or options.compression is not None:
+        # Keep raw bytes in Python mode, JSON can only carry text
+        brep_data = b64encode(data).decode("ascii") if info.mode_is_json() else data
+        result = {"brep": brep_data}
+    else:
+        result = {"brep": data.decode("utf-8")}
+    if options.brep_format == "binary":
+        result["format"] = "binary"
+    if options.compression is not None:
+        result["compression"] = options.compression
+    result["type"] = shape.ShapeType()
     if shape.label:
         result["label"] = shape.label
     return result
 
 
+class ShapeTable:
+    """Collect the distinct shapes of a document.
+
+    Shapes are identified by their TShape, location and orientation (and
+    label), so every distinct shape is exported only once per document and
+    referenced by its index everywhere else.
+    """
+
+    def __init__(self):
+        self.shapes: list[Shape] = []
+        self._indices: dict[int | tuple, list[int]] = {}
+
+    def add(self, shape: Shape) -> int:
+        """Add a shape to the table and return its index."""
+        # Hashing would load lazy shapes, these are matched by identity
+        lazy = isinstance(shape, LazyShape) and not shape.loaded
+        key = ("id", id(shape)) if lazy else shape.hashCode()
+        candidates = self._indices.setdefault(key, [])
+        for index in candidates:
+            other = self.shapes[index]
+            if other is shape or (
+                not lazy
+                and type(other) is type(shape)
+                and other.label == shape.label
+                and other.wrapped.IsEqual(shape.wrapped)
+            ):
+                return index
+
+        index = len(self.shapes)
+        self.shapes.append(shape)
+        candidates.append(index)
+        return index
+
+
+# Reference to an entry of a document's shape table
+shape_ref_schema = core_schema.typed_dict_schema(
+    {"$ref": core_schema.typed_dict_field(core_schema.str_schema())}
+)
+
+
+class SharedGeometry:
+    """The shapes of a document gathered into one compound.
+
+    With the `shared_geometry` option, a document exports a single BREP in
+    which OCC shares curves, surfaces and subshapes between all its shapes.
+    Shape fields refer to a child of the compound by its index, e.g.
+    `{"$ref": "2/geometry", "child": 3}`.
+    """
+
+    def __init__(self, geometry: Shape | None = None):
+        self.shapes: list[Shape] = []
+        self._indices: dict[int, int] = {}
+        if geometry is not None:
+            # Children keep their location and orientation within the compound
+            iterator = TopoDS_Iterator(geometry.wrapped)
+            while iterator.More():
+                self.shapes.append(Shape.cast(iterator.Value()))
+                iterator.Next()
+
+    def ref(self, shape: Shape, depth: int) -> dict:
+        """Add a shape, returning the reference of a field `depth` levels deep."""
+        if id(shape) not in self._indices:
+            self._indices[id(shape)] = len(self.shapes)
+            self.shapes.append(shape)
+        ref = {"$ref": f"{depth}/geometry", "child": self._indices[id(shape)]}
+        if shape.label:
+            ref["label"] = shape.label
+        return ref
+
+    def compound(self) -> Compound:
+        """Get the compound of all added shapes."""
+        return Compound.makeCompound(self.shapes)
+
+    def get(self, ref: dict) -> Shape:
+        """Get the child shape a reference refers to."""
+        if ref["child"] >= len(self.shapes):
+            raise ValueError(f"Shared geometry has no child {ref['child']}")
+        shape = self.shapes[ref["child"]]
+        if "label" in ref:
+            shape.label = ref["label"]
+        return shape
+
+
+def load_shared_geometry(value: dict) -> SharedGeometry | None:
+    """Get the shared geometry of a validated document, if it has one."""
+    geometry = value.get("geometry")
+    return SharedGeometry(geometry) if geometry is not None else None
+
+
+def resolve_geometry_refs(items: list, geometry: SharedGeometry | None) -> list:
+    """Replace references into a document's shared geometry with its shapes."""
+    if not any(isinstance(item, dict) for item in items):
+        return items
+    if geometry is None:
+        raise ValueError("Shape refers to shared geometry, but the document has none")
+    return [geometry.get(item) if isinstance(item, dict) else item for item in items]
+
+
+# Reference to a child of a document's shared geometry
+geometry_ref_schema = core_schema.typed_dict_schema(
+    {
+        "$ref": core_schema.typed_dict_field(core_schema.str_schema()),
+        "child": core_schema.typed_dict_field(core_schema.int_schema(ge=0)),
+        "label": core_schema.typed_dict_field(core_schema.str_schema(), required=False),
+    }
+)
+
+
 shape_from_json_schema = core_schema.chain_schema(
     [
         shape_schema,
@@ -54,6 +457,7 @@ shape_core_schema = core_schema.json_or_python_schema(
     ),
     serialization=core_schema.plain_serializer_function_ser_schema(
         serialize_shape,
+        info_arg=True,
         return_schema=shape_schema,
     ),
 )
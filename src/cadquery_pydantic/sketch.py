@@ -1,8 +1,23 @@
-from cadquery import Sketch
+from cadquery import Shape, Sketch
 from pydantic_core import core_schema
 from cadquery.sketch import Constraint, ConstraintInvariants
-from .shapes import shape_core_schema
-from .geom import location_core_schema
+from .instrumentation import instrumented
+from .options import get_options
+from .shapes import (
+    ShapeTable,
+    SharedGeometry,
+    geometry_ref_schema,
+    load_shared_geometry,
+    resolve_geometry_refs,
+    shape_core_schema,
+)
+from .subshapes import SubshapeIndex, subshape_ref_schema
+from .geom import (
+    PackedArray,
+    location_core_schema,
+    pack_arrays,
+    packed_array_core_schema,
+)
 
 # Create a union schema for all possible parameter types
 constraint_param_schema = core_schema.union_schema(
@@ -31,6 +46,7 @@ constraint_param_schema = core_schema.union_schema(
 
 
 # Constraint schema
+@instrumented("constraint", "validate")
 def validate_constraint(value: dict) -> Constraint:
     return Constraint(
         tags=tuple(value["tags"]),
@@ -40,6 +56,7 @@ def validate_constraint(value: dict) -> Constraint:
     )
 
 
+@instrumented("constraint", "serialize")
 def serialize_constraint(constraint: Constraint) -> dict:
     return {
         "tags": constraint.tags,
@@ -84,53 +101,176 @@ constraint_core_schema = core_schema.json_or_python_schema(
     serialization=core_schema.plain_serializer_function_ser_schema(
         serialize_constraint,
         return_schema=constraint_model_schema,
-        when_used="json",
     ),
 )
 
 
 # Sketch schema
+def sketch_topology(faces: Shape | None, edges: list, shapes: list) -> SubshapeIndex:
+    """Index the shapes of a sketch that selections and tags refer to."""
+    index = SubshapeIndex()
+    if faces is not None:
+        index.add("_faces", faces)
+    for i, edge in enumerate(edges):
+        index.add(f"_edges/{i}", edge)
+    for i, shape in enumerate(shapes):
+        index.add(f"shapes/{i}", shape)
+    return index
+
+
+@instrumented("sketch", "validate")
 def validate_sketch(value: dict) -> Sketch:
     # Create a new Sketch instance without calling __init__
     sketch = object.__new__(Sketch)
 
     # Set fields directly
-    sketch._locs = value.get("_locs", [])
-    sketch._faces = value.get("_faces", [])
-    sketch._edges = value.get("_edges", [])
-    sketch._constraints = value.get("_constraints", [])
-    sketch._selection = value.get("_selection", [])
-    sketch._tags = value.get("_tags", {})
+    locs = value.get("locs", [])
+    sketch.locs = locs.values if isinstance(locs, PackedArray) else locs
+    geometry = load_shared_geometry(value)
+    faces = value.get("_faces", [])
+    if isinstance(faces, dict):
+        faces = resolve_geometry_refs([faces], geometry)[0]
+    sketch._faces = faces
+    sketch._edges = resolve_geometry_refs(value.get("_edges", []), geometry)
+    shapes = resolve_geometry_refs(value.get("shapes", []), geometry)
+
+    # Selections, tags and constraint args refer to the sketch's topology,
+    # resolving a reference twice gives the same object
+    topology = sketch_topology(
+        faces if isinstance(faces, Shape) else None, sketch._edges, shapes
+    )
+
+    def resolve(items: list) -> list:
+        return [
+            topology.get(item["$ref"].split("/", 1)[1], item)
+            if isinstance(item, dict)
+            else item
+            for item in items
+        ]
+
+    sketch._constraints = [
+        validate_constraint({**constraint, "args": tuple(resolve(constraint["args"]))})
+        if isinstance(constraint, dict)
+        else constraint
+        for constraint in value.get("_constraints", [])
+    ]
+
+    selection = value.get("_selection", [])
+    sketch._selection = resolve(selection) if selection is not None else None
+    sketch._tags = {
+        tag: resolve(items) for tag, items in value.get("_tags", {}).items()
+    }
 
     return sketch
 
 
+def _pack_locs(locs: list) -> list | PackedArray:
+    packed = pack_arrays(locs)
+    return (
+        packed[0] if len(packed) == 1 and isinstance(packed[0], PackedArray) else locs
+    )
+
+
+@instrumented("sketch", "serialize")
 def serialize_sketch(sketch: Sketch) -> dict:
-    return {
-        "locs": sketch.locs,
+    # Selected, tagged and constrained shapes are written as references into
+    # the faces and edges, other shapes once into a table of the sketch
+    topology = sketch_topology(sketch._faces, sketch._edges, [])
+    table = ShapeTable()
+
+    def shape_refs(items: list, depth: int) -> list:
+        refs = []
+        for item in items:
+            if isinstance(item, Shape):
+                found = topology.find(item)
+                if found is not None:
+                    path, fields = found
+                    item = {"$ref": f"{depth}/{path}", **fields}
+                else:
+                    item = {"$ref": f"{depth}/shapes/{table.add(item)}"}
+            refs.append(item)
+        return refs
+
+    selection = sketch._selection
+    result = {
+        "locs": _pack_locs(sketch.locs),
         "_faces": sketch._faces,
         "_edges": sketch._edges,
-        "_selection": sketch._selection,
-        "_constraints": sketch._constraints,
-        "_tags": sketch._tags,
+        "_selection": shape_refs(selection, 2) if selection is not None else None,
+        "_constraints": [
+            {
+                **serialize_constraint(constraint),
+                "args": tuple(shape_refs(constraint.args, 4)),
+            }
+            for constraint in sketch._constraints
+        ],
+        "_tags": {tag: shape_refs(items, 3) for tag, items in sketch._tags.items()},
     }
+    if table.shapes:
+        result["shapes"] = table.shapes
+
+    if get_options().shared_geometry:
+        geometry = SharedGeometry()
+        if sketch._faces is not None:
+            result["_faces"] = geometry.ref(sketch._faces, 1)
+        result["_edges"] = [geometry.ref(edge, 2) for edge in sketch._edges]
+        if table.shapes:
+            result["shapes"] = [geometry.ref(shape, 2) for shape in table.shapes]
+        if geometry.shapes:
+            result["geometry"] = geometry.compound()
+    return result
 
 
-# Create schema for SketchVal (which is a tuple of (Edge, Location))
-sketchval_schema = core_schema.tuple_schema(
+# Constraint within a sketch, args are references into the sketch's topology
+sketch_constraint_schema = core_schema.typed_dict_schema(
+    {
+        **constraint_model_schema["fields"],
+        "args": core_schema.model_field(
+            core_schema.tuple_schema(
+                [core_schema.union_schema([subshape_ref_schema, shape_core_schema])],
+                variadic_item_index=0,
+            )
+        ),
+    }
+)
+
+# SketchVal is a Shape or a Location, (Shape, Location) tuples are still accepted.
+# Shapes are references into the sketch's topology, or inline in older payloads
+sketchval_schema = core_schema.union_schema(
     [
+        subshape_ref_schema,
         shape_core_schema,
         location_core_schema,
+        core_schema.tuple_schema(
+            [
+                shape_core_schema,
+                location_core_schema,
+            ]
+        ),
     ]
 )
 
+# Shapes of a sketch, references into its shared geometry in that mode
+shared_shape_schema = core_schema.union_schema([geometry_ref_schema, shape_core_schema])
+
 sketch_model_schema = core_schema.typed_dict_schema(
     {
-        "locs": core_schema.model_field(core_schema.list_schema(location_core_schema)),
+        "shapes": core_schema.typed_dict_field(
+            core_schema.list_schema(shared_shape_schema), required=False
+        ),
+        "geometry": core_schema.typed_dict_field(shape_core_schema, required=False),
+        "locs": core_schema.model_field(
+            core_schema.union_schema(
+                [
+                    core_schema.list_schema(location_core_schema),
+                    packed_array_core_schema,
+                ]
+            )
+        ),
         "_faces": core_schema.model_field(
-            core_schema.union_schema([core_schema.none_schema(), shape_core_schema])
+            core_schema.union_schema([core_schema.none_schema(), shared_shape_schema])
         ),
-        "_edges": core_schema.model_field(core_schema.list_schema(shape_core_schema)),
+        "_edges": core_schema.model_field(core_schema.list_schema(shared_shape_schema)),
         "_selection": core_schema.model_field(
             core_schema.union_schema(
                 [
@@ -140,7 +280,17 @@ sketch_model_schema = core_schema.typed_dict_schema(
             )
         ),
         "_constraints": core_schema.model_field(
-            core_schema.list_schema(constraint_core_schema)
+            core_schema.list_schema(
+                core_schema.json_or_python_schema(
+                    json_schema=sketch_constraint_schema,
+                    python_schema=core_schema.union_schema(
+                        [
+                            core_schema.is_instance_schema(Constraint),
+                            sketch_constraint_schema,
+                        ]
+                    ),
+                )
+            )
         ),
         "_tags": core_schema.model_field(
             core_schema.dict_schema(
@@ -170,6 +320,5 @@ sketch_core_schema = core_schema.json_or_python_schema(
     serialization=core_schema.plain_serializer_function_ser_schema(
         serialize_sketch,
         return_schema=sketch_model_schema,
-        when_used="json",
     ),
 )
@@ -0,0 +1,156 @@
+from collections.abc import Callable, Hashable
+
+from cadquery import Shape
+from OCP.TopAbs import (
+    TopAbs_COMPOUND,
+    TopAbs_COMPSOLID,
+    TopAbs_EDGE,
+    TopAbs_FACE,
+    TopAbs_SHELL,
+    TopAbs_SOLID,
+    TopAbs_VERTEX,
+    TopAbs_WIRE,
+)
+from OCP.TopExp import TopExp
+from OCP.TopTools import TopTools_IndexedMapOfShape
+from pydantic_core import core_schema
+
+from .shapes import LazyShape, shape_classes
+
+subshape_types = {
+    "Vertex": TopAbs_VERTEX,
+    "Edge": TopAbs_EDGE,
+    "Wire": TopAbs_WIRE,
+    "Face": TopAbs_FACE,
+    "Shell": TopAbs_SHELL,
+    "Solid": TopAbs_SOLID,
+    "CompSolid": TopAbs_COMPSOLID,
+    "Compound": TopAbs_COMPOUND,
+}
+
+# Reference to a shape, or one of its subshapes, stored elsewhere in a document
+subshape_ref_schema = core_schema.typed_dict_schema(
+    {
+        "$ref": core_schema.typed_dict_field(core_schema.str_schema()),
+        "subshape": core_schema.typed_dict_field(
+            core_schema.literal_schema(list(shape_classes)), required=False
+        ),
+        "index": core_schema.typed_dict_field(
+            core_schema.int_schema(ge=0), required=False
+        ),
+        "reversed": core_schema.typed_dict_field(
+            core_schema.bool_schema(), required=False
+        ),
+    }
+)
+
+
+class SubshapeIndex:
+    """Locate shapes by their position in the topology of parent shapes.
+
+    Parents are registered under a path (any hashable key). A shape is found either as a parent
+    or as the subshape of a given type and index of a parent, indices follow
+    the order of `TopExp.MapShapes` (the order of e.g. `Shape.Edges()`), which
+    is preserved by BREP export and import. Resolving the same reference
+    twice returns the same object, so shared references survive a round trip.
+    """
+
+    def __init__(self):
+        self.parents: dict[Hashable, Shape] = {}
+        self._maps: dict[tuple, TopTools_IndexedMapOfShape] = {}
+        # Per subshape type, hash of each subshape to (path, index) pairs
+        self._lookup: dict[str | None, dict[int, list[tuple]]] = {}
+        self._resolved: dict[tuple, Shape] = {}
+
+    def add(self, path: Hashable, shape: Shape):
+        """Register a parent shape, parents may be added between lookups."""
+        self.parents[path] = shape
+        for subshape, lookup in self._lookup.items():
+            self._index_parent(lookup, path, subshape)
+
+    def _map(self, path: Hashable, subshape: str) -> TopTools_IndexedMapOfShape:
+        key = (path, subshape)
+        if key not in self._maps:
+            shape_map = TopTools_IndexedMapOfShape()
+            TopExp.MapShapes_s(
+                self.parents[path].wrapped, subshape_types[subshape], shape_map
+            )
+            self._maps[key] = shape_map
+        return self._maps[key]
+
+    def _index_parent(self, lookup: dict, path: Hashable, subshape: str | None):
+        if subshape is None:
+            lookup.setdefault(hash(self.parents[path].wrapped), []).append((path, -1))
+            return
+        shape_map = self._map(path, subshape)
+        for i in range(shape_map.Extent()):
+            lookup.setdefault(hash(shape_map.FindKey(i + 1)), []).append((path, i))
+
+    def _candidates(self, subshape: str | None) -> dict[int, list[tuple]]:
+        # Built on first use, a document without subshapes never maps its parents
+        if subshape not in self._lookup:
+            lookup: dict[int, list[tuple]] = {}
+            for path in self.parents:
+                self._index_parent(lookup, path, subshape)
+            self._lookup[subshape] = lookup
+        return self._lookup[subshape]
+
+    def find(
+        self, shape: Shape, prefer: Callable[[Hashable], bool] | None = None
+    ) -> tuple[Hashable, dict] | None:
+        """Find a shape, returning the parent path and the reference fields.
+
+        If the shape is found under several parents, the first one for which
+        `prefer(path)` is true is returned, else the first one registered.
+        Shapes with a label and unloaded lazy shapes are not looked up, they
+        need to be stored on their own.
+        """
+        if shape.label or (isinstance(shape, LazyShape) and not shape.loaded):
+            return None
+
+        wrapped = shape.wrapped
+        found = None
+        for subshape in (None, shape.ShapeType()):
+            for path, index in self._candidates(subshape).get(hash(wrapped), ()):
+                if subshape is None:
+                    candidate = self.parents[path].wrapped
+                    fields = {}
+                else:
+                    candidate = self._map(path, subshape).FindKey(index + 1)
+                    fields = {"subshape": subshape, "index": index}
+
+                if candidate.IsEqual(wrapped):
+                    match = path, fields
+                elif candidate.Reversed().IsEqual(wrapped):
+                    match = path, {**fields, "reversed": True}
+                else:
+                    continue
+                if prefer is None or prefer(path):
+                    return match
+                found = found or match
+        return found
+
+    def get(self, path: Hashable, ref: dict) -> Shape:
+        """Resolve the reference fields of a shape found under a parent path."""
+        key = (path, ref.get("subshape"), ref.get("index"), ref.get("reversed", False))
+        if key in self._resolved:
+            return self._resolved[key]
+
+        if path not in self.parents:
+            raise ValueError(f"Unknown shape reference {path}")
+        if "subshape" in ref:
+            shape_map = self._map(path, ref["subshape"])
+            index = ref.get("index")
+            if index is None or index >= shape_map.Extent():
+                raise ValueError(f"{path} has no {ref['subshape']} with index {index}")
+            wrapped = shape_map.FindKey(index + 1)
+        elif not ref.get("reversed", False):
+            # The parent itself
+            self._resolved[key] = self.parents[path]
+            return self.parents[path]
+        else:
+            wrapped = self.parents[path].wrapped
+
+        shape = Shape.cast(wrapped.Reversed() if ref.get("reversed") else wrapped)
+        self._resolved[key] = shape
+        return shape
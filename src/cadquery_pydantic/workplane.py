@@ -1,17 +1,42 @@
+from collections.abc import Callable
 from typing import cast
-from cadquery import Workplane
+from cadquery import Location, Shape, Sketch, Vector, Workplane
 from cadquery.cq import CQContext
 from pydantic_core import core_schema
-from .geom import vector_core_schema, location_core_schema, plane_core_schema
-from .shapes import shape_core_schema
-from .sketch import sketch_core_schema
+from .geom import (
+    PackedArray,
+    location_core_schema,
+    location_schema,
+    pack_arrays,
+    packed_array_core_schema,
+    plane_core_schema,
+    serialize_location,
+    serialize_vector,
+    unpack_arrays,
+    vector_core_schema,
+    vector_schema,
+)
+from .instrumentation import instrumented
+from .options import get_options
+from .shapes import (
+    LazyShape,
+    ShapeTable,
+    SharedGeometry,
+    geometry_ref_schema,
+    load_shared_geometry,
+    resolve_geometry_refs,
+    shape_classes,
+    shape_core_schema,
+)
+from .sketch import serialize_sketch, sketch_core_schema, sketch_model_schema
+from .subshapes import SubshapeIndex, subshape_ref_schema
 
 
-def get_workplane_id(wp: Workplane | None) -> str | None:
-    """Get a consistent string ID for a workplane instance."""
+def get_workplane_id(wp: Workplane | None, ids: dict[int, str]) -> str | None:
+    """Get the document ID of a workplane instance."""
     if wp is None:
         return None
-    return str(id(wp))
+    return ids[id(wp)]
 
 
 def extract_id_from_ref(ref: str | None) -> str | None:
@@ -21,51 +46,155 @@ def extract_id_from_ref(ref: str | None) -> str | None:
     return ref.split("/")[-1]
 
 
-# CQObject schema - Union of all possible object types in a workplane
-cqobject_core_schema = core_schema.union_schema(
+def with_type_tag(
+    schema: core_schema.CoreSchema,
+    tag: str,
+    serialize: Callable[[object], dict],
+    model_schema: core_schema.TypedDictSchema,
+) -> core_schema.CoreSchema:
+    """Copy a core schema, adding a "type" tag to its serialized form."""
+    return {
+        **schema,
+        "serialization": core_schema.plain_serializer_function_ser_schema(
+            lambda value: {"type": tag, **serialize(value)},
+            return_schema=core_schema.typed_dict_schema(
+                {
+                    "type": core_schema.typed_dict_field(core_schema.str_schema()),
+                    **model_schema["fields"],
+                }
+            ),
+        ),
+    }
+
+
+# Untagged union of all possible object types in a workplane, the fallback
+# for payloads written before objects were tagged
+legacy_cqobject_core_schema = core_schema.union_schema(
     [
         vector_core_schema,
         location_core_schema,
         shape_core_schema,
         sketch_core_schema,
+        subshape_ref_schema,
+        packed_array_core_schema,
     ]
 )
 
+# Tags of the Python types, shapes are tagged with their shape type
+cqobject_tags = {
+    Vector: "Vector",
+    Location: "Location",
+    Sketch: "Sketch",
+    PackedArray: "packed",
+}
+
+
+def get_cqobject_tag(value) -> str:
+    """Get the tag of a workplane object, serialized or not."""
+    if isinstance(value, dict):
+        tag = value.get("type")
+        if tag in shape_classes or "brep" in value or "blob" in value:
+            return "shape"
+        if tag is not None:
+            return tag
+        if "$ref" in value:
+            return "ref"
+        if "packed" in value:
+            return "packed"
+        return "legacy"
+
+    if isinstance(value, Shape):
+        return "shape"
+    return cqobject_tags.get(type(value), "legacy")
+
+
+# CQObject schema - Objects are dispatched on their tag instead of trying
+# every member of the union
+cqobject_core_schema = core_schema.tagged_union_schema(
+    {
+        "Vector": with_type_tag(
+            vector_core_schema, "Vector", serialize_vector, vector_schema
+        ),
+        "Location": with_type_tag(
+            location_core_schema, "Location", serialize_location, location_schema
+        ),
+        "Sketch": with_type_tag(
+            sketch_core_schema, "Sketch", serialize_sketch, sketch_model_schema
+        ),
+        "shape": shape_core_schema,
+        "ref": subshape_ref_schema,
+        "packed": packed_array_core_schema,
+        "legacy": legacy_cqobject_core_schema,
+    },
+    discriminator=get_cqobject_tag,
+)
+
+# Pending wires and edges are shapes or references into the shape table
+pending_shapes_schema = core_schema.list_schema(
+    core_schema.union_schema([shape_core_schema, subshape_ref_schema])
+)
+
+
+def resolve_shape_refs(objects: list, topology: SubshapeIndex) -> list:
+    """Replace references into the shape table with the referenced shapes.
 
-def collect_related_workplanes(
-    wp: Workplane, collected: set[Workplane] | None = None
-) -> set[Workplane]:
-    """Recursively collect all related workplanes through parent links and context tags."""
-    if collected is None:
-        collected = set()
+    References may select a subshape of a table entry, see `SubshapeIndex`.
+    """
+    return [
+        topology.get(int(extract_id_from_ref(obj["$ref"])), obj)
+        if isinstance(obj, dict)
+        else obj
+        for obj in objects
+    ]
 
-    if wp in collected:
-        return collected
 
-    collected.add(wp)
+@instrumented("workplane", "traverse")
+def collect_related_workplanes(wp: Workplane) -> list[Workplane]:
+    """Collect all related workplanes through parent links and context tags.
+
+    Workplanes are returned in a deterministic order, each one after its parent.
+    """
+    # Find all workplanes, without recursion to support long chains
+    found: dict[int, Workplane] = {}
+    visited_contexts: set[int] = set()
+    stack = [wp]
+    while stack:
+        current = stack.pop()
+        if id(current) in found:
+            continue
+        found[id(current)] = current
+
+        # Tags are stored in the context, which is usually shared by all workplanes
+        if id(current.ctx) not in visited_contexts:
+            visited_contexts.add(id(current.ctx))
+            stack.extend(
+                tagged_wp
+                for tagged_wp in reversed(current.ctx.tags.values())
+                if isinstance(tagged_wp, Workplane)
+            )
 
-    # Add parent if it exists
-    if wp.parent is not None and isinstance(wp.parent, Workplane):
-        parent = cast(Workplane, wp.parent)
-        collect_related_workplanes(parent, collected)
+        if current.parent is not None and isinstance(current.parent, Workplane):
+            stack.append(cast(Workplane, current.parent))
 
-    # Add all tagged workplanes
-    for tagged_wp in wp.ctx.tags.values():
-        if isinstance(tagged_wp, Workplane):
-            collect_related_workplanes(tagged_wp, collected)
+    # Order them parents first
+    ordered: dict[int, Workplane] = {}
+    for current in found.values():
+        chain = []
+        while current is not None and id(current) not in ordered:
+            chain.append(current)
+            parent = current.parent
+            current = parent if isinstance(parent, Workplane) else None
+        for workplane in reversed(chain):
+            ordered[id(workplane)] = workplane
 
-    return collected
+    return list(ordered.values())
 
 
 # Schema for a workplane's context
 workplane_ctx_schema = core_schema.typed_dict_schema(
     {
-        "pendingWires": core_schema.typed_dict_field(
-            core_schema.list_schema(shape_core_schema)
-        ),
-        "pendingEdges": core_schema.typed_dict_field(
-            core_schema.list_schema(shape_core_schema)
-        ),
+        "pendingWires": core_schema.typed_dict_field(pending_shapes_schema),
+        "pendingEdges": core_schema.typed_dict_field(pending_shapes_schema),
         "firstPoint": core_schema.typed_dict_field(
             core_schema.union_schema([core_schema.none_schema(), vector_core_schema])
         ),
@@ -125,6 +254,13 @@ workplane_model_schema = core_schema.typed_dict_schema(
                 {"$ref": core_schema.typed_dict_field(core_schema.str_schema())}
             )
         ),
+        "shapes": core_schema.typed_dict_field(
+            core_schema.list_schema(
+                core_schema.union_schema([geometry_ref_schema, shape_core_schema])
+            ),
+            required=False,
+        ),
+        "geometry": core_schema.typed_dict_field(shape_core_schema, required=False),
         "workplanes": core_schema.typed_dict_field(
             core_schema.dict_schema(
                 core_schema.str_schema(),
@@ -136,14 +272,19 @@ workplane_model_schema = core_schema.typed_dict_schema(
 )
 
 
+@instrumented("workplane", "validate")
 def validate_workplane(value: dict) -> Workplane:
     """Validate and construct a Workplane from a dictionary."""
     workplanes = {}
+    shapes = resolve_geometry_refs(value.get("shapes", []), load_shared_geometry(value))
+    topology = SubshapeIndex()
+    for i, shape in enumerate(shapes):
+        topology.add(i, shape)
 
     # Create shared context
     ctx = object.__new__(CQContext)
-    ctx.pendingWires = value["ctx"]["pendingWires"]
-    ctx.pendingEdges = value["ctx"]["pendingEdges"]
+    ctx.pendingWires = resolve_shape_refs(value["ctx"]["pendingWires"], topology)
+    ctx.pendingEdges = resolve_shape_refs(value["ctx"]["pendingEdges"], topology)
     ctx.firstPoint = value["ctx"]["firstPoint"]
     ctx.tolerance = value["ctx"]["tolerance"]
     ctx.tags = {}  # Will be populated in second pass
@@ -152,7 +293,7 @@ def validate_workplane(value: dict) -> Workplane:
     for wp_id, wp_data in value["workplanes"].items():
         wp = object.__new__(Workplane)
         wp.plane = wp_data["plane"]
-        wp.objects = wp_data["objects"]
+        wp.objects = resolve_shape_refs(unpack_arrays(wp_data["objects"]), topology)
         wp.parent = None  # Will be set in second pass
         wp._tag = wp_data["_tag"]
         wp.ctx = ctx  # Share the same context
@@ -179,19 +320,66 @@ def validate_workplane(value: dict) -> Workplane:
     return workplanes[root_id]
 
 
+class WorkplaneShapes:
+    """Shape references of a workplane document.
+
+    Shapes are stored once in a shape table and referenced by index.
+    Subshapes of stored shapes, e.g. selected faces or edges, are referenced
+    by type and index within the stored shape instead. References are made in
+    document order, which decides the shapes that are stored.
+    """
+
+    def __init__(self, wp: Workplane, all_workplanes: list[Workplane]):
+        self.table = ShapeTable()
+        self.topology = SubshapeIndex()
+        self.pending_wires = self._refs(wp.ctx.pendingWires or [], 3)
+        self.pending_edges = self._refs(wp.ctx.pendingEdges or [], 3)
+        self.objects = {
+            id(workplane): self._refs(workplane.objects, 4)
+            for workplane in all_workplanes
+        }
+
+    def _ref(self, shape: Shape, depth: int) -> dict:
+        found = self.topology.find(shape)
+        if found is not None:
+            index, fields = found
+            return {"$ref": f"{depth}/shapes/{index}", **fields}
+
+        index = self.table.add(shape)
+        if index not in self.topology.parents and (
+            not isinstance(shape, LazyShape) or shape.loaded
+        ):
+            self.topology.add(index, shape)
+        return {"$ref": f"{depth}/shapes/{index}"}
+
+    def _refs(self, objects: list, depth: int) -> list:
+        return [
+            self._ref(obj, depth) if isinstance(obj, Shape) else obj for obj in objects
+        ]
+
+
+def collect_workplane_shapes(wp: Workplane) -> list[Shape]:
+    """Collect the shapes stored in the shape table of a workplane document."""
+    return WorkplaneShapes(wp, collect_related_workplanes(wp)).table.shapes
+
+
+@instrumented("workplane", "serialize")
 def serialize_workplane(wp: Workplane) -> dict:
     """Serialize a Workplane to a dictionary."""
-    # Collect all related workplanes
+    # Collect all related workplanes, IDs follow the (deterministic) traversal
+    # order so that equal workplanes serialize to identical output
     all_workplanes = collect_related_workplanes(wp)
+    ids = {id(workplane): str(i) for i, workplane in enumerate(all_workplanes)}
+    shapes = WorkplaneShapes(wp, all_workplanes)
 
     # Get the shared context from the root workplane
     ctx = {
-        "pendingWires": wp.ctx.pendingWires if wp.ctx.pendingWires is not None else [],
-        "pendingEdges": wp.ctx.pendingEdges if wp.ctx.pendingEdges is not None else [],
+        "pendingWires": shapes.pending_wires,
+        "pendingEdges": shapes.pending_edges,
         "firstPoint": wp.ctx.firstPoint,
         "tolerance": wp.ctx.tolerance,
         "tags": {
-            tag: {"$ref": f"3/{get_workplane_id(tagged_wp)}"}
+            tag: {"$ref": f"3/{get_workplane_id(tagged_wp, ids)}"}
             if tagged_wp is not None
             else None
             for tag, tagged_wp in wp.ctx.tags.items()
@@ -201,20 +389,26 @@ def serialize_workplane(wp: Workplane) -> dict:
     # Serialize each workplane
     workplanes = {}
     for workplane in all_workplanes:
-        workplanes[get_workplane_id(workplane)] = {
+        workplanes[get_workplane_id(workplane, ids)] = {
             "plane": workplane.plane,
-            "objects": workplane.objects,
-            "parent": {"$ref": f"2/{get_workplane_id(workplane.parent)}"}
+            "objects": pack_arrays(shapes.objects[id(workplane)]),
+            "parent": {"$ref": f"2/{get_workplane_id(workplane.parent, ids)}"}
             if workplane.parent is not None
             else None,
             "_tag": workplane._tag,
         }
 
-    return {
-        "root": {"$ref": f"0/workplanes/{get_workplane_id(wp)}"},
+    result = {
+        "root": {"$ref": f"0/workplanes/{get_workplane_id(wp, ids)}"},
+        "shapes": shapes.table.shapes,
         "workplanes": workplanes,
         "ctx": ctx,
     }
+    if get_options().shared_geometry and shapes.table.shapes:
+        geometry = SharedGeometry()
+        result["shapes"] = [geometry.ref(shape, 2) for shape in shapes.table.shapes]
+        result["geometry"] = geometry.compound()
+    return result
 
 
 workplane_from_json_schema = core_schema.chain_schema(
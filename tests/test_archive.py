@@ -0,0 +1,80 @@
+import cadquery as cq
+import pytest
+from pydantic_core import PydanticSerializationError
+
+from cadquery_pydantic import (
+    AssemblyArchive,
+    patch_cadquery,
+    serialization_options,
+    write_assembly_archive,
+)
+
+patch_cadquery()
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    box = cq.Workplane("XY").box(1, 1, 1)
+    sub = (
+        cq.Assembly(name="sub", loc=cq.Location((0, 5, 0)))
+        .add(box, name="a")
+        .add(cq.Solid.makeBox(1, 2, 3), name="b", loc=cq.Location((3, 0, 0)))
+    )
+    top = cq.Assembly(name="top").add(sub).add(box, name="c")
+    top.constrain("c", "Fixed")
+
+    path = tmp_path / "assembly.cqa"
+    write_assembly_archive(top, path)
+    return path
+
+
+def test_archive_load_all(archive_path):
+    with AssemblyArchive(archive_path) as archive:
+        assert archive.names() == ["top", "top/sub", "top/sub/a", "top/sub/b", "top/c"]
+        top = archive.load()
+
+    assert [child.name for child in top.children] == ["sub", "c"]
+    assert [spec.objects for spec in top.constraints] == [("c",)]
+    sub = top.children[0]
+    assert sub.loc.toTuple()[0] == pytest.approx((0, 5, 0))
+    assert sub.children[1].obj.Volume() == pytest.approx(6)
+
+
+def test_archive_load_subtree(archive_path):
+    with AssemblyArchive(archive_path) as archive:
+        sub = archive.load("top/sub")
+
+        with pytest.raises(KeyError):
+            archive.load("top/missing")
+
+    assert sub.parent.name == "top"
+    assert sub.parent.obj is None
+    assert sub.parent.children == [sub]
+    assert [child.name for child in sub.children] == ["a", "b"]
+    assert sub.constraints == []
+    assert sub.children[0].obj.val().Volume() == pytest.approx(1)
+
+
+def test_archive_invalid(tmp_path):
+    path = tmp_path / "invalid.cqa"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError, match="not an assembly archive"):
+        AssemblyArchive(path)
+
+
+def test_archive_lazy_options(archive_path):
+    with serialization_options(lazy=True), AssemblyArchive(archive_path) as archive:
+        sub = archive.load("top/sub")
+
+    # Shapes were parsed before the mapping was closed
+    assert sub.children[1].obj.Volume() == pytest.approx(6)
+
+
+def test_archive_failed_write(archive_path):
+    original = archive_path.read_bytes()
+    with pytest.raises(PydanticSerializationError):
+        write_assembly_archive(object(), archive_path)
+
+    # The previous archive is kept and no temporary file is left behind
+    assert archive_path.read_bytes() == original
+    assert [p.name for p in archive_path.parent.iterdir()] == [archive_path.name]
@@ -1,5 +1,21 @@
+import json
+import math
+import warnings
+import pytest
+from typing import Annotated
 from cadquery import Assembly, Workplane, Location, Color
-from cadquery_pydantic import patch_cadquery
+from pydantic import TypeAdapter
+from cadquery_pydantic import (
+    SerializationMemo,
+    SerializationOptions,
+    ShapeCache,
+    instrument,
+    load_assembly_subtree,
+    patch_cadquery,
+    serialization_options,
+)
+from cadquery_pydantic import parallel, shapes
+from cadquery_pydantic.assembly import collect_related_assemblies
 
 patch_cadquery()
 
@@ -157,3 +173,296 @@ def test_json_serialization(check_serialization):
         return True
 
     check_serialization(assembly, Assembly, check_equality)
+
+
+def test_assembly_instances():
+    # The same part is reused by many nodes
+    bolt = Workplane().cylinder(5, 1)
+    assembly = Assembly()
+    for i in range(20):
+        assembly.add(bolt, name=f"bolt_{i}", loc=Location((i, 0, 0)))
+
+    adapter = TypeAdapter(Assembly)
+    serialized = json.loads(adapter.dump_json(assembly))
+    assert len(serialized["instances"]) == 1
+
+    restored = adapter.validate_json(json.dumps(serialized))
+    objs = [restored.objects[f"bolt_{i}"].obj for i in range(20)]
+    assert isinstance(objs[0], Workplane)
+    assert all(obj is objs[0] for obj in objs)
+    assert restored.objects["bolt_3"].loc.toTuple()[0][0] == 3
+
+
+def test_parallel_assembly():
+    assembly = Assembly()
+    for i in range(8):
+        assembly.add(Workplane().box(1, 1, i + 1), name=f"part_{i}")
+
+    serial = TypeAdapter(Annotated[Assembly, SerializationOptions(compression="zlib")])
+    parallel = TypeAdapter(
+        Annotated[
+            Assembly,
+            SerializationOptions(compression="zlib", workers=2, parallel_threshold=4),
+        ]
+    )
+
+    # The process pool produces the same payload as serial encoding
+    payload = parallel.dump_json(assembly)
+    assert payload == serial.dump_json(assembly)
+
+    restored = parallel.validate_json(payload)
+    for i in range(8):
+        assert abs(restored.objects[f"part_{i}"].obj.val().Volume() - (i + 1)) < 1e-6
+
+
+class RecordingExecutor:
+    """Runs pool tasks in the test process and records them."""
+
+    def __init__(self):
+        self.tasks = []
+
+    def map(self, func, tasks, chunksize=1):
+        tasks = list(tasks)
+        self.tasks += tasks
+        return [func(task) for task in tasks]
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    recording = RecordingExecutor()
+    monkeypatch.setattr(parallel, "get_executor", lambda workers: recording)
+    return recording
+
+
+def make_parts(count: int) -> Assembly:
+    assembly = Assembly(name="root")
+    for i in range(count):
+        assembly.add(Workplane().box(1, 1, i + 1), name=f"part_{i}")
+    return assembly
+
+
+def test_parallel_import_skips(executor):
+    payload = TypeAdapter(Assembly).dump_json(make_parts(4))
+    options = {"workers": 2, "parallel_threshold": 1}
+
+    # Lazy shapes are parsed on first use in this process
+    with serialization_options(lazy=True, **options):
+        restored = TypeAdapter(Assembly).validate_json(payload)
+    assert executor.tasks == []
+    assert not restored.objects["part_0"].obj.val().loaded
+
+    # Shapes in the cache are not parsed again
+    cache = ShapeCache()
+    with serialization_options(shape_cache=cache, **options):
+        TypeAdapter(Assembly).validate_json(payload)
+        assert len(executor.tasks) == 4
+        restored = TypeAdapter(Assembly).validate_json(payload)
+    assert len(executor.tasks) == 4
+    assert cache.hits == 8
+    assert abs(restored.objects["part_3"].obj.val().Volume() - 4) < 1e-6
+
+    # Partial loading only parses the payloads of the subtree
+    with serialization_options(**options):
+        part = load_assembly_subtree(payload, "root/part_2")
+    assert len(executor.tasks) == 5
+    assert abs(part.obj.val().Volume() - 3) < 1e-6
+
+
+def test_parallel_import_small_cache(executor, monkeypatch):
+    payload = TypeAdapter(Assembly).dump_json(make_parts(40))
+    formats = []
+    import_brep = shapes.import_brep
+
+    def recording_import(data, brep_format="text"):
+        formats.append(brep_format)
+        return import_brep(data, brep_format)
+
+    monkeypatch.setattr(shapes, "import_brep", recording_import)
+
+    # Results the cache cannot hold are passed in the document, not parsed again
+    cache = ShapeCache(max_entries=8)
+    with serialization_options(shape_cache=cache, workers=2, parallel_threshold=4):
+        restored = TypeAdapter(Assembly).validate_json(payload)
+    assert len(executor.tasks) == 40
+    assert formats == ["binary"] * 40
+    assert len(cache) == 8
+    for i in range(40):
+        assert abs(restored.objects[f"part_{i}"].obj.val().Volume() - (i + 1)) < 1e-6
+
+
+def test_parallel_export_skips_memoized(executor):
+    assembly = make_parts(4)
+    memo = SerializationMemo()
+    with serialization_options(serialization_memo=memo, compression="zlib"):
+        expected = TypeAdapter(Assembly).dump_json(assembly)
+        with serialization_options(workers=2, parallel_threshold=1):
+            assert TypeAdapter(Assembly).dump_json(assembly) == expected
+    assert executor.tasks == []
+
+
+def test_parallel_export_stored_shapes(executor):
+    assembly = Assembly(name="root")
+    for i in range(4):
+        wp = Workplane().box(1, 1, i + 1).faces(">Z").edges()
+        assembly.add(wp, name=f"part_{i}")
+    expected = TypeAdapter(Assembly).dump_json(assembly)
+
+    # Selected faces and edges are references, only the solids are exported
+    memo = SerializationMemo()
+    options = {"workers": 2, "parallel_threshold": 1, "serialization_memo": memo}
+    with serialization_options(**options):
+        assert TypeAdapter(Assembly).dump_json(assembly) == expected
+    assert len(executor.tasks) == 4
+    assert len(memo) == 4
+
+
+def test_deep_assembly():
+    root = Assembly(name="level_0")
+    current = root
+    for i in range(1, 3000):
+        child = Assembly(name=f"level_{i}")
+        child.parent = current
+        current.children.append(child)
+        current.objects[child.name] = child
+        current = child
+
+    collected = collect_related_assemblies(current)
+    assert [a.name for a in collected[:3]] == ["level_0", "level_1", "level_2"]
+    assert len(collected) == 3000
+
+    restored = TypeAdapter(Assembly).validate_json(
+        TypeAdapter(Assembly).dump_json(root)
+    )
+    assert restored.name == "level_0"
+    assert restored.children[0].children[0].name == "level_2"
+
+
+def test_assembly_deterministic_output():
+    def build():
+        assembly = Assembly(name="root")
+        assembly.add(Workplane().box(1, 1, 1), name="box", color=Color(1, 0, 0))
+        sub = Assembly(name="sub")
+        sub.add(Workplane().sphere(1), name="sphere", loc=Location((2, 0, 0)))
+        assembly.add(sub)
+        assembly.constrain("box", "Fixed", None)
+        return assembly
+
+    adapter = TypeAdapter(Assembly)
+    assert adapter.dump_json(build()) == adapter.dump_json(build())
+
+
+def test_load_assembly_subtree():
+    core = Assembly(name="core").add(Workplane().box(1, 1, 1), name="rod")
+    tank = Assembly(name="tank", loc=Location((0, 0, 10))).add(core)
+    tank.add(Workplane().box(5, 5, 5), name="shell")
+    root = Assembly(name="root").add(tank).add(Workplane().sphere(1), name="pump")
+    root.constrain("pump", "Fixed", None)
+    payload = TypeAdapter(Assembly).dump_json(root)
+
+    with instrument() as stats:
+        loaded = load_assembly_subtree(payload, "root/tank/core")
+
+    # Only the shape of the subtree is parsed
+    assert stats.get("shape", "validate").calls == 1
+    assert loaded.name == "core"
+    assert loaded.children[0].obj.val().Volume() == pytest.approx(1)
+    assert loaded.constraints == []
+
+    # Ancestors keep their locations but no objects or other children
+    assert loaded.parent.name == "tank"
+    assert loaded.parent.loc.toTuple()[0] == pytest.approx((0, 0, 10))
+    assert loaded.parent.children == [loaded]
+    assert loaded.parent.parent.name == "root"
+    assert loaded.parent.parent.obj is None
+
+    assert len(load_assembly_subtree(payload, "root").constraints) == 1
+    with pytest.raises(KeyError):
+        load_assembly_subtree(payload, "root/missing")
+
+
+def test_load_assembly_subtree_shared_geometry():
+    root = (
+        Assembly(name="root")
+        .add(Workplane().box(1, 1, 1), name="box")
+        .add(Workplane().sphere(1).val(), name="ball")
+    )
+    shared = TypeAdapter(
+        Annotated[Assembly, SerializationOptions(shared_geometry=True)]
+    )
+    payload = shared.dump_json(root)
+
+    # The workplane has its own geometry, the compound of the assembly is skipped
+    with warnings.catch_warnings(), instrument() as stats:
+        warnings.simplefilter("error")
+        box = load_assembly_subtree(payload, "root/box")
+    assert stats.get("shape", "validate").calls == 1
+    assert box.obj.val().Volume() == pytest.approx(1)
+
+    with pytest.warns(UserWarning, match="parsed as a whole"):
+        ball = load_assembly_subtree(payload, "root/ball")
+    assert ball.obj.Volume() == pytest.approx(4 / 3 * math.pi, rel=1e-3)
+
+
+def test_assembly_object_tags():
+    assembly = Assembly(name="root")
+    assembly.add(Workplane().box(1, 1, 1), name="box")
+    assembly.add(Workplane().sphere(1).val(), name="sphere")
+    adapter = TypeAdapter(Assembly)
+
+    serialized = json.loads(adapter.dump_json(assembly))
+    assert [obj["type"] for obj in serialized["instances"]] == ["Workplane", "Solid"]
+
+    # Untagged workplanes are still accepted
+    del serialized["instances"][0]["type"]
+    restored = adapter.validate_json(json.dumps(serialized))
+    assert isinstance(restored.objects["box"].obj, Workplane)
+    assert restored.objects["sphere"].obj.ShapeType() == "Solid"
+
+
+def test_constraint_arg_references():
+    box = Workplane().box(1, 1, 1)
+    assembly = (
+        Assembly(name="root")
+        .add(box, name="box1")
+        .add(box.val(), name="box2", loc=Location((2, 0, 0)))
+    )
+    sub = Assembly(name="sub").add(
+        Workplane().sphere(1), name="ball", loc=Location((0, 0, 5))
+    )
+    assembly.add(sub)
+    assembly.constrain("box1", "Fixed")
+    assembly.constrain("box1@faces@>Z", "box2@faces@<Z", "Plane")
+    assembly.constrain("box2@vertices@>X and >Y and >Z", "sub/ball", "Point")
+    # The first face is not a subshape of any object
+    assembly.constrain(
+        "box1",
+        Workplane().box(3, 3, 3).faces(">Z").val(),
+        "box2",
+        box.faces("<Z").val(),
+        "Axis",
+    )
+    adapter = TypeAdapter(Assembly)
+
+    serialized = json.loads(adapter.dump_json(assembly))
+    args = [spec["args"] for spec in serialized["constraints"]]
+    assert args[0] == [{"object": "box1", "shape": 0}]
+    assert args[1][0] == {"object": "box1", "shape": 0, "subshape": "Face", "index": 5}
+    assert args[1][1]["object"] == "box2" and "shape" not in args[1][1]
+    assert args[2][0]["subshape"] == "Vertex"
+    assert args[2][1] == {"object": "sub/ball", "shape": 0}
+    assert "brep" in args[3][0]
+    assert args[3][1] == {"object": "box2", "subshape": "Face", "index": 4}
+
+    restored = adapter.validate_json(json.dumps(serialized))
+    specs = restored.constraints
+    assert specs[0].args[0] is restored.objects["box1"].obj.val()
+    box1, box2 = restored.objects["box1"].obj, restored.objects["box2"].obj
+    assert specs[1].args[0].wrapped.IsEqual(box1.faces(">Z").val().wrapped)
+    assert specs[1].args[1].wrapped.IsEqual(box2.Faces()[4].wrapped)
+    assert specs[2].objects == ("box2", "sub")
+    assert [spec.sublocs[0].toTuple() for spec in specs] == [
+        spec.sublocs[0].toTuple() for spec in assembly.constraints
+    ]
+
+    # The restored constraints can be solved
+    restored.solve()
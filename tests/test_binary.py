@@ -0,0 +1,62 @@
+from typing import Annotated
+
+import cadquery as cq
+import pytest
+from pydantic import BaseModel, TypeAdapter
+
+from cadquery_pydantic import (
+    SerializationOptions,
+    dump_msgpack,
+    patch_cadquery,
+    serialization_options,
+    validate_msgpack,
+)
+
+msgpack = pytest.importorskip("msgpack")
+
+patch_cadquery()
+
+
+class Document(BaseModel):
+    name: str
+    part: cq.Workplane
+    assembly: cq.Assembly
+    sketch: cq.Sketch
+
+
+def make_document() -> Document:
+    part = cq.Workplane("XY").box(2, 2, 1).faces(">Z").workplane().hole(0.5)
+    assembly = cq.Assembly(name="top").add(part, name="part", color=cq.Color("red"))
+    sketch = cq.Sketch().push([(0, 0), (5, 0)]).rect(1, 1)
+    return Document(name="doc", part=part, assembly=assembly, sketch=sketch)
+
+
+def test_msgpack_model_roundtrip():
+    document = make_document()
+    data = dump_msgpack(document)
+    restored = validate_msgpack(data, Document)
+
+    assert restored.name == "doc"
+    assert abs(restored.part.val().Volume() - document.part.val().Volume()) < 1e-8
+    assert restored.assembly.children[0].name == "part"
+    assert len(restored.sketch._faces.Faces()) == 2
+
+
+def test_msgpack_raw_bytes():
+    box = cq.Workplane("XY").box(1, 1, 1).val()
+    BinaryShape = Annotated[
+        cq.Shape, SerializationOptions(brep_format="binary", compression="zlib")
+    ]
+
+    data = dump_msgpack(box, BinaryShape)
+    assert isinstance(msgpack.unpackb(data)["brep"], bytes)
+    assert len(data) < len(TypeAdapter(BinaryShape).dump_json(box))
+    assert abs(validate_msgpack(data, cq.Shape).Volume() - 1) < 1e-10
+
+
+def test_msgpack_smaller_than_json():
+    document = make_document()
+    with serialization_options(brep_format="binary"):
+        data = dump_msgpack(document)
+        payload = document.model_dump_json()
+    assert len(data) < len(payload)
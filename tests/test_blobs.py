@@ -0,0 +1,88 @@
+from typing import Annotated
+
+import cadquery as cq
+import pytest
+from pydantic import TypeAdapter, ValidationError
+
+from cadquery_pydantic import (
+    DirectoryBlobStore,
+    MemoryBlobStore,
+    SerializationOptions,
+    patch_cadquery,
+    serialization_options,
+)
+
+patch_cadquery()
+
+
+@pytest.fixture(params=["memory", "directory"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBlobStore()
+    return DirectoryBlobStore(tmp_path / "blobs")
+
+
+def test_blob_store_roundtrip(store):
+    adapter = TypeAdapter(
+        Annotated[
+            cq.Shape, SerializationOptions(brep_format="binary", blob_store=store)
+        ]
+    )
+    box = cq.Solid.makeBox(1, 2, 3)
+    box.label = "box"
+
+    data = adapter.dump_python(box)
+    assert "brep" not in data
+    assert data["blob"] in store
+    assert data["format"] == "binary"
+
+    payload = adapter.dump_json(box)
+    assert len(payload) < 200
+    restored = adapter.validate_json(payload)
+    assert restored.label == "box"
+    assert abs(restored.Volume() - 6) < 1e-10
+
+
+def test_blob_store_writes_once():
+    store = MemoryBlobStore()
+    puts = []
+    put = store.put
+    store.put = lambda key, data: (puts.append(key), put(key, data))
+
+    box = cq.Workplane("XY").box(1, 1, 1)
+    assembly = cq.Assembly().add(box, name="a").add(box.translate((2, 0, 0)), name="b")
+    adapter = TypeAdapter(cq.Assembly)
+    with serialization_options(blob_store=store):
+        adapter.dump_json(assembly)
+        adapter.dump_json(assembly)
+
+    assert len(puts) == len(store) == 2
+
+
+def test_blob_store_missing():
+    store = MemoryBlobStore()
+    adapter = TypeAdapter(cq.Shape)
+    with serialization_options(blob_store=store):
+        data = adapter.dump_python(cq.Solid.makeBox(1, 1, 1))
+
+    with pytest.raises(ValidationError, match="no blob store"):
+        adapter.validate_python(data)
+    with (
+        serialization_options(blob_store=MemoryBlobStore()),
+        pytest.raises(ValidationError, match="not found"),
+    ):
+        adapter.validate_python(data)
+
+
+def test_blob_store_lazy_passthrough():
+    store = MemoryBlobStore()
+    adapter = TypeAdapter(cq.Shape)
+    with serialization_options(blob_store=store):
+        data = adapter.dump_python(cq.Solid.makeBox(1, 1, 1))
+        with serialization_options(lazy=True):
+            shape = adapter.validate_python(data)
+        assert adapter.dump_python(shape)["blob"] == data["blob"]
+        assert not shape.loaded
+
+    # Loading after the block still uses the store it was validated with
+    assert abs(shape.Volume() - 1) < 1e-10
@@ -0,0 +1,111 @@
+import gc
+from typing import Annotated
+
+import cadquery as cq
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import (
+    SerializationMemo,
+    SerializationOptions,
+    ShapeCache,
+    patch_cadquery,
+    serialization_options,
+)
+
+patch_cadquery()
+
+
+def test_shape_cache_hits():
+    cache = ShapeCache()
+    adapter = TypeAdapter(Annotated[cq.Shape, SerializationOptions(shape_cache=cache)])
+    box = cq.Workplane("XY").box(1, 1, 1).val()
+    payload = adapter.dump_json(box)
+
+    first = adapter.validate_json(payload)
+    second = adapter.validate_json(payload)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(cache) == 1
+
+    # Returned shapes share geometry but are separate wrappers
+    assert first is not second
+    assert first.wrapped.IsEqual(second.wrapped)
+    assert abs(second.Volume() - 1) < 1e-10
+
+
+def test_shape_cache_labels():
+    cache = ShapeCache()
+    adapter = TypeAdapter(Annotated[cq.Shape, SerializationOptions(shape_cache=cache)])
+    box = cq.Workplane("XY").box(1, 1, 1).val()
+    box.label = "original"
+    payload = adapter.dump_python(box)
+
+    first = adapter.validate_python(payload)
+    first.label = "changed"
+    first.move(cq.Location((10, 0, 0)))
+
+    # Label is not part of the key, but changes do not leak into the cache
+    second = adapter.validate_python({**payload, "label": "other"})
+    assert cache.hits == 1
+    assert second.label == "other"
+    assert abs(second.Center().x) < 1e-10
+    assert adapter.validate_python(payload).label == "original"
+
+
+def test_shape_cache_eviction():
+    shapes = [cq.Workplane("XY").box(1, 1, i + 1).val() for i in range(3)]
+    payloads = [TypeAdapter(cq.Shape).dump_python(shape) for shape in shapes]
+
+    cache = ShapeCache(max_entries=2)
+    adapter = TypeAdapter(Annotated[cq.Shape, SerializationOptions(shape_cache=cache)])
+    for payload in payloads:
+        adapter.validate_python(payload)
+    assert len(cache) == 2
+
+    # The oldest payload was evicted
+    adapter.validate_python(payloads[0])
+    assert (cache.hits, cache.misses) == (0, 4)
+
+    size = len(payloads[0]["brep"])
+    cache = ShapeCache(max_entries=None, max_bytes=size * 2)
+    adapter = TypeAdapter(Annotated[cq.Shape, SerializationOptions(shape_cache=cache)])
+    for payload in payloads:
+        adapter.validate_python(payload)
+    assert cache.size <= size * 2
+    assert len(cache) < 3
+
+
+def test_serialization_memo():
+    memo = SerializationMemo()
+    adapter = TypeAdapter(cq.Shape)
+    box = cq.Workplane("XY").box(1, 1, 1).val()
+
+    with serialization_options(serialization_memo=memo):
+        first = adapter.dump_json(box)
+        second = adapter.dump_json(box)
+        # Another wrapper of the same OCC shape hits the same entry
+        adapter.dump_json(cq.Shape.cast(box.wrapped))
+    assert first == second
+    assert (memo.hits, memo.misses) == (2, 1)
+    assert len(memo) == 1
+
+    # The memo is only used while it is active
+    adapter.dump_json(box)
+    assert memo.hits == 2
+
+    # Moving the shape changes its location and thereby the key
+    with serialization_options(serialization_memo=memo):
+        adapter.dump_json(box.moved(cq.Location((1, 0, 0))))
+    assert memo.misses == 2
+
+
+def test_serialization_memo_eviction():
+    memo = SerializationMemo()
+    box = cq.Workplane("XY").box(1, 1, 1).val()
+
+    with serialization_options(serialization_memo=memo):
+        TypeAdapter(cq.Shape).dump_python(box)
+    assert len(memo) == 1
+
+    del box
+    gc.collect()
+    assert len(memo) == 0
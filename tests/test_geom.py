@@ -1,5 +1,10 @@
-from cadquery_pydantic import patch_cadquery
+import json
+
 import cadquery as cq
+import pytest
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import patch_cadquery, serialization_options
 
 patch_cadquery()
 
@@ -34,6 +39,21 @@ def test_matrix_serialization(check_serialization):
 
     check_serialization(matrix, cq.Matrix, check_equality)
 
+    # Translation and rotation survive the round trip
+    matrix = cq.Matrix(cq.Location((1, 2, 3), (0, 0, 1), 90).wrapped.Transformation())
+    check_serialization(matrix, cq.Matrix, check_equality)
+
+
+def test_matrix_row_major():
+    # Rows are written in order, the translation is the last column
+    matrix = cq.Matrix(cq.Location((1, 2, 3)).wrapped.Transformation())
+    serialized = TypeAdapter(cq.Matrix).dump_python(matrix)
+    assert [row[3] for row in serialized] == [1, 2, 3, 1]
+    assert serialized[3] == [0, 0, 0, 1]
+
+    restored = TypeAdapter(cq.Matrix).validate_python(serialized)
+    assert restored.transposed_list() == matrix.transposed_list()
+
 
 def test_plane_serialization(check_serialization):
     def check_equality(p1: cq.Plane, p2: cq.Plane) -> bool:
@@ -112,3 +132,69 @@ def test_location_serialization(check_serialization):
     # Test with a different location
     custom_location = cq.Location(x=2, y=3, z=4, rx=90, ry=0, rz=0)
     check_serialization(custom_location, cq.Location, check_equality)
+
+
+@pytest.mark.parametrize("encoding", ["floats", "buffer"])
+def test_packed_arrays(encoding):
+    vectors = [cq.Vector(i, i / 3, -i) for i in range(20)]
+    locations = [cq.Location((i, 0, 1), (0, 0, 1), i * 7.5) for i in range(20)]
+    box = cq.Solid.makeBox(1, 1, 1)
+    wp = cq.Workplane().newObject(vectors + [box] + locations)
+    adapter = TypeAdapter(cq.Workplane)
+
+    for dump, validate in (
+        (adapter.dump_json, adapter.validate_json),
+        (adapter.dump_python, adapter.validate_python),
+    ):
+        with serialization_options(array_encoding=encoding):
+            data = dump(wp)
+        restored = validate(data).objects
+
+        assert [type(obj) for obj in restored] == [type(obj) for obj in wp.objects]
+        for original, obj in zip(vectors, restored[:20]):
+            assert obj.toTuple() == pytest.approx(original.toTuple())
+        for original, obj in zip(locations, restored[21:]):
+            for part, expected in zip(obj.toTuple(), original.toTuple()):
+                assert part == pytest.approx(expected)
+
+    objects = json.loads(adapter.dump_json(wp))["workplanes"]["1"]["objects"]
+    assert len(objects) == 41
+    with serialization_options(array_encoding=encoding):
+        objects = json.loads(adapter.dump_json(wp))["workplanes"]["1"]["objects"]
+    assert [obj.get("packed") for obj in objects] == ["Vector", None, "Location"]
+
+
+def test_packed_sketch_locations():
+    sketch = cq.Sketch().rect(1, 1)
+    sketch.locs = [cq.Location((i, 0, 0)) for i in range(10)]
+    adapter = TypeAdapter(cq.Sketch)
+
+    with serialization_options(array_encoding="buffer"):
+        payload = adapter.dump_json(sketch)
+    assert json.loads(payload)["locs"]["packed"] == "Location"
+    restored = adapter.validate_json(payload)
+    assert [loc.toTuple()[0][0] for loc in restored.locs] == list(range(10))
+
+
+def test_packed_array_count_mismatch():
+    with pytest.raises(ValueError, match="does not match"):
+        TypeAdapter(cq.Workplane).validate_python(
+            {
+                "root": {"$ref": "0/workplanes/0"},
+                "workplanes": {
+                    "0": {
+                        "plane": cq.Plane.XY(),
+                        "objects": [{"packed": "Vector", "count": 2, "data": [1.0]}],
+                        "parent": None,
+                        "_tag": None,
+                    }
+                },
+                "ctx": {
+                    "pendingWires": [],
+                    "pendingEdges": [],
+                    "firstPoint": None,
+                    "tolerance": 1e-4,
+                    "tags": {},
+                },
+            }
+        )
@@ -0,0 +1,61 @@
+import cadquery as cq
+from cadquery.sketch import Constraint
+from pydantic import TypeAdapter
+
+from cadquery_pydantic import Instrumentation, instrument, patch_cadquery
+
+patch_cadquery()
+
+
+def test_instrument_counts_types():
+    box = cq.Workplane("XY").box(1, 1, 1)
+    assembly = cq.Assembly().add(box, name="box")
+    adapter = TypeAdapter(cq.Assembly)
+
+    with instrument() as stats:
+        payload = adapter.dump_json(assembly)
+
+    assert stats.get("assembly", "serialize").calls == 1
+    assert stats.get("assembly", "traverse").calls >= 1
+    assert stats.get("workplane", "serialize").calls == 1
+    shape = stats.get("shape", "serialize")
+    assert shape.calls == 1
+    assert shape.bytes > 0
+    assert shape.seconds > 0
+    assert stats.get("shape", "validate").calls == 0
+
+    with instrument() as stats:
+        adapter.validate_json(payload)
+
+    assert stats.get("assembly", "validate").calls == 1
+    assert stats.get("shape", "validate").bytes == shape.bytes
+    assert set(stats.summary()) == {"assembly", "shape", "workplane"}
+
+
+def test_instrument_sketch_constraints():
+    sketch = cq.Sketch().rect(1, 1)
+    edge = cq.Edge.makeLine(cq.Vector(0, 0, 0), cq.Vector(1, 0, 0))
+    sketch._constraints.append(Constraint(("s1",), (edge,), "Fixed", None))
+    adapter = TypeAdapter(cq.Sketch)
+
+    with instrument() as stats:
+        adapter.validate_json(adapter.dump_json(sketch))
+
+    for kind in ("sketch", "constraint"):
+        assert stats.get(kind, "serialize").calls == 1
+        assert stats.get(kind, "validate").calls == 1
+
+
+def test_instrument_disabled_and_accumulate():
+    adapter = TypeAdapter(cq.Shape)
+    box = cq.Solid.makeBox(1, 1, 1)
+
+    stats = Instrumentation()
+    adapter.dump_json(box)
+    assert stats.summary() == {}
+
+    with instrument(stats):
+        adapter.dump_json(box)
+    with instrument(stats):
+        adapter.dump_json(box)
+    assert stats.get("shape", "serialize").calls == 2
@@ -0,0 +1,184 @@
+from typing import Annotated
+
+import cadquery as cq
+import numpy as np
+import pytest
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from cadquery_pydantic import (
+    AssemblyMesh,
+    Mesh,
+    SerializationMemo,
+    SerializationOptions,
+    instrument,
+    patch_cadquery,
+)
+
+patch_cadquery()
+
+
+def mesh_arrays(mesh: Mesh):
+    vertices = np.frombuffer(mesh.vertices, dtype="<f4").reshape(-1, 3)
+    normals = np.frombuffer(mesh.normals, dtype="<f4").reshape(-1, 3)
+    triangles = np.frombuffer(mesh.triangles, dtype="<u4").reshape(-1, 3)
+    return vertices, normals, triangles
+
+
+def test_shape_mesh(check_serialization):
+    box = cq.Solid.makeBox(1, 2, 3)
+    mesh = TypeAdapter(Mesh).validate_python(box)
+
+    # Four vertices and two triangles per face
+    assert (mesh.vertex_count, mesh.triangle_count) == (24, 12)
+    vertices, normals, triangles = mesh_arrays(mesh)
+    assert vertices.max(axis=0).tolist() == [1, 2, 3]
+    assert np.allclose(np.linalg.norm(normals, axis=1), 1)
+
+    # Triangles wind counter-clockwise around the outward normals
+    a, b, c = (vertices[triangles[:, i]] for i in range(3))
+    assert (
+        np.einsum("ij,ij->i", np.cross(b - a, c - a), normals[triangles[:, 0]]) > 0
+    ).all()
+
+    check_serialization(mesh, Mesh, lambda m1, m2: m1 == m2)
+
+
+def test_mesh_tolerance():
+    sphere = cq.Solid.makeSphere(1, angleDegrees1=-90)
+    coarse = TypeAdapter(Mesh).validate_python(sphere)
+    fine = TypeAdapter(
+        Annotated[Mesh, SerializationOptions(mesh_tolerance=0.001)]
+    ).validate_python(sphere)
+
+    assert fine.triangle_count > coarse.triangle_count
+
+
+def test_mesh_leaves_shape_unchanged():
+    """Test that meshing does not store a triangulation on the shape."""
+    sphere = cq.Solid.makeSphere(1, angleDegrees1=-90)
+    size = len(TypeAdapter(cq.Shape).dump_json(sphere))
+    memo = SerializationMemo()
+
+    def mesh(tolerance: float, angular_tolerance: float) -> Mesh:
+        options = SerializationOptions(
+            mesh_tolerance=tolerance,
+            mesh_angular_tolerance=angular_tolerance,
+            mesh_cache=memo,
+        )
+        return TypeAdapter(Annotated[Mesh, options]).validate_python(sphere)
+
+    # A fine mesh is not reused for a coarser tolerance, in or out of the cache
+    fine = mesh(0.01, 0.1)
+    coarse = mesh(1.0, 1.0)
+    assert coarse.triangle_count < fine.triangle_count
+    assert mesh(1.0, 1.0) is coarse
+
+    assert len(TypeAdapter(cq.Shape).dump_json(sphere)) == size
+    box = cq.Solid.makeBox(1, 1, 1)
+    memo = SerializationMemo()
+    adapter = TypeAdapter(Annotated[Mesh, SerializationOptions(mesh_cache=memo)])
+
+    with instrument() as instrumentation:
+        first = adapter.validate_python(box)
+        assert adapter.validate_python(box) is first
+        # Same shape, different tolerance
+        with_tolerance = TypeAdapter(
+            Annotated[Mesh, SerializationOptions(mesh_cache=memo, mesh_tolerance=0.01)]
+        )
+        with_tolerance.validate_python(box)
+
+    assert instrumentation.get("mesh", "tessellate").calls == 2
+    assert memo.hits == 1
+
+
+def test_assembly_mesh_cache():
+    box = cq.Solid.makeBox(1, 1, 1)
+    assembly = (
+        cq.Assembly(name="top")
+        .add(cq.Workplane().box(1, 1, 1).pushPoints([(3, 0)]).box(1, 1, 1), name="wp")
+        .add(box, name="box")
+    )
+    memo = SerializationMemo()
+    adapter = TypeAdapter(
+        Annotated[AssemblyMesh, SerializationOptions(mesh_cache=memo)]
+    )
+
+    first = adapter.validate_python(assembly)
+    with instrument() as instrumentation:
+        second = adapter.validate_python(assembly)
+
+    # Both the workplane and the solid are served from the cache
+    assert instrumentation.get("mesh", "tessellate").calls == 0
+    assert memo.hits == 2
+    assert second.meshes == first.meshes
+
+
+def test_merged_mesh():
+    wp = cq.Workplane().newObject([cq.Solid.makeBox(1, 1, 1), cq.Solid.makeSphere(1)])
+    assembly = cq.Assembly(wp, name="top")
+
+    mesh = TypeAdapter(AssemblyMesh).validate_python(assembly).meshes[0]
+    box, sphere = (TypeAdapter(Mesh).validate_python(s) for s in wp.vals())
+    assert mesh.vertex_count == box.vertex_count + sphere.vertex_count
+    assert mesh.triangle_count == box.triangle_count + sphere.triangle_count
+
+    # Indices of the second shape refer to its own vertices
+    _, _, triangles = mesh_arrays(mesh)
+    assert triangles[box.triangle_count :].min() == box.vertex_count
+    assert triangles.max() == mesh.vertex_count - 1
+
+
+def test_assembly_mesh(check_serialization):
+    box = cq.Solid.makeBox(1, 1, 1)
+    assembly = (
+        cq.Assembly(box, name="top", color=cq.Color("red"))
+        .add(cq.Workplane().sphere(1), name="sphere", loc=cq.Location((5, 0, 0)))
+        .add(box, name="box", loc=cq.Location((0, 5, 0)), color=cq.Color("blue"))
+    )
+
+    class Viewer(BaseModel):
+        assembly: AssemblyMesh
+
+    result = Viewer(assembly=assembly).assembly
+
+    # The box is meshed once and placed twice
+    assert len(result.meshes) == 2
+    assert [part.name for part in result.parts] == ["top", "top/sphere", "top/box"]
+    assert [part.mesh for part in result.parts] == [0, 1, 0]
+    assert result.parts[2].transform.transposed_list()[12:15] == [0, 5, 0]
+    colors = [part.color.toTuple() for part in result.parts]
+    assert colors[1] == colors[0] != colors[2]
+
+    def check_equality(m1: AssemblyMesh, m2: AssemblyMesh) -> bool:
+        assert m1.meshes == m2.meshes
+        for p1, p2 in zip(m1.parts, m2.parts, strict=True):
+            assert (p1.name, p1.mesh) == (p2.name, p2.mesh)
+            assert p1.transform.transposed_list() == p2.transform.transposed_list()
+            assert (p1.color is None) == (p2.color is None)
+        return True
+
+    check_serialization(result, AssemblyMesh, check_equality)
+
+    # FastAPI style response serialization
+    data = Viewer(assembly=assembly).model_dump(mode="json")
+    assert isinstance(data["assembly"]["meshes"][0]["vertices"], str)
+
+
+def test_invalid_mesh():
+    adapter = TypeAdapter(Mesh)
+    data = adapter.dump_python(adapter.validate_python(cq.Solid.makeBox(1, 1, 1)))
+
+    with pytest.raises(ValidationError):
+        adapter.validate_python({**data, "vertex_count": 3})
+    with pytest.raises(ValidationError):
+        adapter.validate_python({**data, "normals": data["normals"][:-4]})
+
+    with pytest.raises(ValidationError):
+        TypeAdapter(AssemblyMesh).validate_python(
+            {
+                "meshes": [data],
+                "parts": [
+                    {"name": "a", "mesh": 1, "transform": cq.Matrix(), "color": None}
+                ],
+            }
+        )
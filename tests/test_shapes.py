@@ -1,4 +1,13 @@
-from cadquery_pydantic import patch_cadquery
+import json
+from typing import Annotated
+import pytest
+from pydantic import TypeAdapter
+from cadquery_pydantic import (
+    patch_cadquery,
+    serialization_options,
+    SerializationOptions,
+)
+from cadquery_pydantic.shapes import LazyShape, compression_codecs
 import cadquery as cq
 
 patch_cadquery()
@@ -21,3 +30,248 @@ def test_shape_serialization(check_serialization):
     cylinder = cq.Workplane("XY").cylinder(1, 1).val()
     cylinder.label = "test_cylinder"
     check_serialization(cylinder, cq.Shape, check_equality)
+
+
+def test_binary_shape_serialization(check_serialization):
+    def check_equality(s1: cq.Shape, s2: cq.Shape) -> bool:
+        assert s1.label == s2.label
+        assert abs(s1.Volume() - s2.Volume()) < 1e-10
+        return True
+
+    box = cq.Workplane("XY").box(1, 2, 3).val()
+    box.label = "binary_box"
+
+    with serialization_options(brep_format="binary"):
+        check_serialization(box, cq.Shape, check_equality)
+
+    check_serialization(
+        box,
+        Annotated[cq.Shape, SerializationOptions(brep_format="binary")],
+        check_equality,
+    )
+
+
+def test_binary_shape_payload():
+    box = cq.Workplane("XY").box(1, 1, 1).val()
+    adapter = TypeAdapter(
+        Annotated[cq.Shape, SerializationOptions(brep_format="binary")]
+    )
+
+    serialized_py = adapter.dump_python(box)
+    assert serialized_py["format"] == "binary"
+    assert isinstance(serialized_py["brep"], bytes)
+
+    serialized_json = json.loads(adapter.dump_json(box))
+    assert serialized_json["format"] == "binary"
+    assert isinstance(serialized_json["brep"], str)
+
+    # Text payloads are still accepted by an adapter configured for binary
+    text_json = TypeAdapter(cq.Shape).dump_json(box)
+    assert abs(adapter.validate_json(text_json).Volume() - 1) < 1e-10
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma", "zstd"])
+@pytest.mark.parametrize("brep_format", ["text", "binary"])
+def test_compressed_shape_serialization(check_serialization, compression, brep_format):
+    if compression not in compression_codecs:
+        pytest.skip(f"{compression} is not available")
+
+    def check_equality(s1: cq.Shape, s2: cq.Shape) -> bool:
+        assert s1.label == s2.label
+        assert abs(s1.Volume() - s2.Volume()) < 1e-10
+        return True
+
+    cylinder = cq.Workplane("XY").cylinder(1, 1).val()
+    cylinder.label = "compressed"
+    options = SerializationOptions(brep_format=brep_format, compression=compression)
+    check_serialization(cylinder, Annotated[cq.Shape, options], check_equality)
+
+    adapter = TypeAdapter(Annotated[cq.Shape, options])
+    payload = json.loads(adapter.dump_json(cylinder))
+    assert payload["compression"] == compression
+    assert len(payload["brep"]) < len(
+        TypeAdapter(cq.Shape).dump_python(cylinder)["brep"]
+    )
+
+
+def test_compression_level():
+    box = cq.Workplane("XY").box(1, 1, 1).edges().fillet(0.1).val()
+    fast = TypeAdapter(
+        Annotated[
+            cq.Shape, SerializationOptions(compression="zlib", compression_level=1)
+        ]
+    )
+    small = TypeAdapter(
+        Annotated[
+            cq.Shape, SerializationOptions(compression="zlib", compression_level=9)
+        ]
+    )
+    assert len(small.dump_python(box)["brep"]) <= len(fast.dump_python(box)["brep"])
+
+    # Compressed payloads are decompressed transparently by any adapter
+    restored = TypeAdapter(cq.Shape).validate_json(small.dump_json(box))
+    assert abs(restored.Volume() - box.Volume()) < 1e-10
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        TypeAdapter(cq.Shape).validate_python({"brep": b"", "compression": "unknown"})
+
+
+def test_lazy_shape():
+    box = cq.Workplane("XY").box(1, 2, 3).val()
+    box.label = "lazy_box"
+    payload = TypeAdapter(cq.Shape).dump_json(box)
+
+    adapter = TypeAdapter(Annotated[cq.Shape, SerializationOptions(lazy=True)])
+    lazy = adapter.validate_json(payload)
+    assert isinstance(lazy, LazyShape)
+    assert isinstance(lazy, cq.Solid)
+    assert lazy.label == "lazy_box"
+    assert not lazy.loaded
+
+    # Untouched lazy shapes are passed through without an export
+    assert adapter.dump_json(lazy) == payload
+    assert not lazy.loaded
+
+    assert abs(lazy.Volume() - 6) < 1e-10
+    assert lazy.loaded
+
+
+def test_lazy_workplane():
+    wp = cq.Workplane("XY").box(1, 1, 1)
+    adapter = TypeAdapter(Annotated[cq.Workplane, SerializationOptions(lazy=True)])
+
+    restored = adapter.validate_json(adapter.dump_json(wp))
+    assert not restored.val().loaded
+
+    # Lazy shapes work with regular workplane operations
+    result = restored.faces(">Z").workplane().hole(0.5)
+    assert result.val().Volume() < 1
+
+
+def test_lazy_shape_transforms():
+    """Test that transforms, which rebuild the shape class, work on lazy shapes."""
+    box = cq.Workplane("XY").box(1, 2, 3)
+    adapter = TypeAdapter(Annotated[cq.Workplane, SerializationOptions(lazy=True)])
+    payload = adapter.dump_json(box)
+
+    lazy = adapter.validate_json(payload).val()
+    location = cq.Location((1, 0, 0))
+    results = [
+        lazy.copy(),
+        lazy.moved(location),
+        lazy.located(location),
+        lazy.translate(cq.Vector(1, 0, 0)),
+        lazy.rotate(cq.Vector(), cq.Vector(0, 0, 1), 90),
+        lazy.mirror("XY"),
+        lazy.scale(2),
+    ]
+    for result in results:
+        assert isinstance(result, cq.Solid)
+        assert abs(result.Volume() - (48 if result is results[-1] else 6)) < 1e-6
+    assert lazy.Center().toTuple() == pytest.approx((0, 0, 0))
+
+    # Transformed lazy shapes serialize as regular shapes
+    moved = adapter.validate_json(adapter.dump_json(cq.Workplane().add(results[1])))
+    assert moved.val().Center().toTuple() == pytest.approx((1, 0, 0))
+
+    restored = adapter.validate_json(payload)
+    translated = restored.translate((0, 0, 5))
+    assert translated.val().Center().toTuple() == pytest.approx((0, 0, 5))
+    assert restored.val().Center().toTuple() == pytest.approx((0, 0, 0))
+
+
+SharedWorkplane = Annotated[cq.Workplane, SerializationOptions(shared_geometry=True)]
+SharedSketch = Annotated[cq.Sketch, SerializationOptions(shared_geometry=True)]
+SharedAssembly = Annotated[cq.Assembly, SerializationOptions(shared_geometry=True)]
+
+
+def test_shared_geometry_workplane(check_serialization):
+    # Two solids sharing the faces of the base box
+    base = cq.Workplane("XY").box(2, 2, 2)
+    wp = base.union(cq.Workplane("XY").sphere(1.2).translate((1, 1, 1))).tag("union")
+    wp = wp.newObject([wp.val(), base.val(), base.val().moved(cq.Location((5, 0, 0)))])
+    wp.val().label = "union"
+
+    serialized = TypeAdapter(SharedWorkplane).dump_python(wp)
+    assert serialized["geometry"]["type"] == "Compound"
+    # Shapes are stored in the order of the workplane chain, base box first
+    assert serialized["shapes"] == [
+        {"$ref": "2/geometry", "child": 0},
+        {"$ref": "2/geometry", "child": 1, "label": "union"},
+        {"$ref": "2/geometry", "child": 2},
+    ]
+
+    def check_equality(w1: cq.Workplane, w2: cq.Workplane) -> bool:
+        assert [s.label for s in w2.vals()] == ["union", "", ""]
+        for s1, s2 in zip(w1.vals(), w2.vals(), strict=True):
+            assert type(s2) is type(s1)
+            assert abs(s1.Volume() - s2.Volume()) < 1e-6
+            assert s1.Center() == s2.Center()
+        assert w2.ctx.tags["union"].val() is w2.parent.val()
+        return True
+
+    check_serialization(wp, SharedWorkplane, check_equality)
+
+    # The default mode still writes one BREP per shape
+    assert "geometry" not in TypeAdapter(cq.Workplane).dump_python(wp)
+
+
+def test_shared_geometry_sketch(check_serialization):
+    sketch = (
+        cq.Sketch()
+        .segment((0, 0), (1, 0), "s1")
+        .segment((1, 1), "s2")
+        .close("s3")
+        .constrain("s1", "Fixed", None)
+        .constrain("s1", "s2", "Coincident", None)
+    )
+
+    serialized = TypeAdapter(SharedSketch).dump_python(sketch)
+    assert serialized["_faces"] == {"$ref": "1/geometry", "child": 0}
+    assert serialized["_edges"][2] == {"$ref": "2/geometry", "child": 3}
+
+    def check_equality(s1: cq.Sketch, s2: cq.Sketch) -> bool:
+        assert len(s2._edges) == 3
+        assert s2._tags["s2"][0] is s2._edges[1]
+        assert s2._constraints[1].args[1] is s2._edges[1]
+        return True
+
+    check_serialization(sketch, SharedSketch, check_equality)
+
+
+def test_shared_geometry_assembly(check_serialization):
+    box = cq.Solid.makeBox(1, 1, 1)
+    assembly = (
+        cq.Assembly(name="root")
+        .add(box, name="a")
+        .add(box, name="b", loc=cq.Location((2, 0, 0)))
+        .add(cq.Workplane().sphere(1), name="ball")
+    )
+    # The first face is not part of an object
+    assembly.constrain(
+        "a", cq.Solid.makeBox(3, 3, 3).Faces()[0], "b", box.Faces()[1], "Plane"
+    )
+
+    serialized = TypeAdapter(SharedAssembly).dump_python(assembly)
+    assert serialized["instances"][0] == {"$ref": "2/geometry", "child": 0}
+    assert serialized["constraints"][0]["args"][0] == {"$ref": "4/geometry", "child": 1}
+    # Workplanes keep their own document
+    assert serialized["instances"][1]["type"] == "Workplane"
+
+    def check_equality(a1: cq.Assembly, a2: cq.Assembly) -> bool:
+        assert a2.objects["a"].obj is a2.objects["b"].obj
+        assert abs(a2.objects["a"].obj.Volume() - 1) < 1e-10
+        assert abs(a2.constraints[0].args[0].Area() - 9) < 1e-10
+        return True
+
+    check_serialization(assembly, SharedAssembly, check_equality)
+
+
+def test_shared_geometry_missing():
+    data = TypeAdapter(SharedWorkplane).dump_python(cq.Workplane().box(1, 1, 1))
+    del data["geometry"]
+
+    with pytest.raises(ValueError, match="the document has none"):
+        TypeAdapter(cq.Workplane).validate_python(data)
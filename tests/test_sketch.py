@@ -92,3 +92,136 @@ def test_sketch_serialization(check_serialization):
         return True
 
     check_serialization(sketch, cq.Sketch, check_equality)
+
+
+def test_sketch_locations(check_serialization):
+    """Test that sketch locations survive a round trip in both modes."""
+    sketch = cq.Sketch().push([(0, 0), (5, 0)]).rect(1, 1)
+    sketch.locs = [cq.Location((1, 2, 0)), cq.Location((3, 4, 0))]
+
+    def check_equality(s1: cq.Sketch, s2: cq.Sketch) -> bool:
+        assert [loc.toTuple() for loc in s1.locs] == [loc.toTuple() for loc in s2.locs]
+        assert len(s2._faces.Faces()) == 2
+        return True
+
+    check_serialization(sketch, cq.Sketch, check_equality)
+    assert isinstance(TypeAdapter(cq.Sketch).dump_python(sketch), dict)
+
+
+def test_sketch_python_mode():
+    """Test that Python mode dumps sketches and constraints as plain data."""
+    sketch = cq.Sketch().segment((0, 0), (1, 0), "s1").segment((1, 1), "s2")
+    sketch.constrain("s1", "Fixed", None)
+    sketch.locs = [cq.Location((1, 2, 0))]
+
+    serialized = TypeAdapter(cq.Sketch).dump_python(sketch)
+    assert isinstance(serialized["locs"][0], dict)
+    assert isinstance(serialized["_constraints"][0], dict)
+    assert isinstance(serialized["_edges"][0]["brep"], str)
+
+    constraint = TypeAdapter(Constraint).dump_python(sketch._constraints[0])
+    assert constraint["kind"] == "Fixed"
+    assert isinstance(constraint["args"][0], dict)
+
+    # Locations are read from the "locs" key the serializer writes
+    restored = TypeAdapter(cq.Sketch).validate_python(serialized)
+    assert restored.locs[0].toTuple() == sketch.locs[0].toTuple()
+
+
+def test_sketch_tag_references():
+    """Test that selected and tagged shapes are stored once as references."""
+    adapter = TypeAdapter(cq.Sketch)
+    sketch = cq.Sketch().rect(4, 4).vertices().fillet(0.5).reset().edges().tag("all")
+    size = len(adapter.dump_json(sketch))
+    for i in range(20):
+        sketch = sketch.reset().edges(">X").tag(f"x{i}")
+    sketch = sketch.vertices()
+
+    data = adapter.dump_python(sketch)
+    assert data["_tags"]["x0"] == [{"$ref": "3/_faces", "subshape": "Edge", "index": 5}]
+    assert "shapes" not in data
+
+    # Tags add references, not BREP payloads
+    assert len(adapter.dump_json(sketch)) < size + 2000
+
+    loaded = adapter.validate_json(adapter.dump_json(sketch))
+    edge = loaded._tags["x0"][0]
+    assert all(loaded._tags[f"x{i}"][0] is edge for i in range(20))
+    assert edge.wrapped.IsEqual(loaded._faces.Edges()[5].wrapped)
+    assert [v.toTuple() for v in loaded._selection] == [
+        v.toTuple() for v in sketch._selection
+    ]
+    assert loaded.reset().edges(tag="x3")._selection == [edge]
+
+
+def test_sketch_edge_references():
+    """Test references into the edges of an edge-based sketch."""
+    adapter = TypeAdapter(cq.Sketch)
+    sketch = (
+        cq.Sketch()
+        .segment((0, 0), (1, 0), "a")
+        .segment((1, 1), "b")
+        .close("c")
+        .edges("%LINE")
+        .tag("lines")
+    )
+    # A shape that is not part of the sketch
+    sketch._tags["other"] = [cq.Edge.makeCircle(1)] * 2
+
+    data = adapter.dump_python(sketch)
+    assert data["_tags"]["a"] == [{"$ref": "3/_edges/0"}]
+    assert data["_tags"]["other"] == [{"$ref": "3/shapes/0"}] * 2
+    assert len(data["shapes"]) == 1
+
+    loaded = adapter.validate_python(data)
+    assert loaded._tags["lines"] == loaded._edges
+    assert loaded._tags["a"][0] is loaded._edges[0]
+    assert loaded._selection == loaded._edges
+    assert loaded._tags["other"][0] is loaded._tags["other"][1]
+
+
+def test_sketch_invalid_reference():
+    adapter = TypeAdapter(cq.Sketch)
+    data = adapter.dump_python(cq.Sketch().rect(1, 1).edges().tag("edges"))
+
+    data["_tags"]["edges"] = [{"$ref": "3/_faces", "subshape": "Edge", "index": 4}]
+    with pytest.raises(ValueError, match="no Edge with index 4"):
+        adapter.validate_python(data)
+
+    data["_tags"]["edges"] = [{"$ref": "3/_edges/0"}]
+    with pytest.raises(ValueError, match="Unknown shape reference"):
+        adapter.validate_python(data)
+
+
+def test_sketch_constraint_references(check_serialization):
+    """Test that constraint args are references to the sketch's edges."""
+    sketch = (
+        cq.Sketch()
+        .segment((0, 0), (1, 0), "s1")
+        .arc((1, 0), (2, 1), (3, 0), "a1")
+        .segment((0, 0), "s2")
+        .constrain("s1", "Fixed", None)
+        .constrain("s1", "a1", "Coincident", None)
+        .constrain("a1", "s2", "Coincident", None)
+        .constrain("s2", "s1", "Coincident", None)
+        .constrain("s2", "Length", 3.0)
+    )
+
+    data = TypeAdapter(cq.Sketch).dump_python(sketch)
+    assert data["_constraints"][1]["args"] == (
+        {"$ref": "4/_edges/0"},
+        {"$ref": "4/_edges/1"},
+    )
+
+    def check_equality(s1: cq.Sketch, s2: cq.Sketch) -> bool:
+        for c1, c2 in zip(s1._constraints, s2._constraints, strict=True):
+            assert (c1.tags, c1.kind, c1.param) == (c2.tags, c2.kind, c2.param)
+            # The solver sees the sketch's own edges
+            assert all(
+                arg is s2._edges[s1._edges.index(orig)]
+                for arg, orig in zip(c2.args, c1.args)
+            )
+        s2.solve()
+        return True
+
+    check_serialization(sketch, cq.Sketch, check_equality)
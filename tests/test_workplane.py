@@ -1,5 +1,9 @@
+import json
+import pytest
 import cadquery as cq
+from pydantic import TypeAdapter
 from cadquery_pydantic import patch_cadquery
+from cadquery_pydantic.workplane import collect_related_workplanes
 
 patch_cadquery()
 
@@ -62,3 +66,133 @@ def test_workplane_with_parent(check_serialization):
         return True
 
     check_serialization(child, cq.Workplane, check_equality)
+
+
+def test_workplane_shape_table():
+    """Shapes shared between workplanes are stored and imported once."""
+    wp = cq.Workplane("XY").box(1, 1, 1).tag("base").first().first()
+    adapter = TypeAdapter(cq.Workplane)
+
+    serialized = json.loads(adapter.dump_json(wp))
+    assert len(serialized["shapes"]) == 1
+
+    restored = adapter.validate_json(json.dumps(serialized))
+    solids = [
+        workplane.objects[0]
+        for workplane in (restored, restored.parent, restored.ctx.tags["base"])
+    ]
+    assert isinstance(solids[0], cq.Solid)
+    assert all(solid is solids[0] for solid in solids)
+
+
+def test_workplane_selection_references():
+    """Selected subshapes are references into shapes of parent workplanes."""
+    wp = cq.Workplane("XY").box(1, 2, 3).faces(">Z").edges().tag("top").end()
+    wp = wp.vertices("<X")
+    adapter = TypeAdapter(cq.Workplane)
+
+    serialized = json.loads(adapter.dump_json(wp))
+    assert len(serialized["shapes"]) == 1
+    face_wp, vertex_wp, edge_wp = (serialized["workplanes"][i] for i in "234")
+    assert face_wp["objects"] == [
+        {"$ref": "4/shapes/0", "subshape": "Face", "index": 5}
+    ]
+    assert [obj["subshape"] for obj in vertex_wp["objects"]] == ["Vertex"] * 2
+    assert [obj["subshape"] for obj in edge_wp["objects"]] == ["Edge"] * 4
+
+    restored = adapter.validate_json(json.dumps(serialized))
+    top = restored.ctx.tags["top"]
+    solid = top.parent.parent.val()
+    assert top.parent.val().wrapped.IsEqual(solid.Faces()[5].wrapped)
+    for edge, expected in zip(top.vals(), wp.ctx.tags["top"].vals(), strict=True):
+        assert edge.wrapped.Orientation() == expected.wrapped.Orientation()
+        assert edge.Center() == expected.Center()
+    assert [v.toTuple() for v in restored.vals()] == [v.toTuple() for v in wp.vals()]
+
+
+def test_workplane_inline_shapes():
+    """Payloads with shapes inlined in the objects are still accepted."""
+    box = cq.Workplane("XY").box(1, 1, 1)
+    adapter = TypeAdapter(cq.Workplane)
+
+    serialized = adapter.dump_python(box)
+    for workplane in serialized["workplanes"].values():
+        workplane["objects"] = [
+            serialized["shapes"][int(obj["$ref"].split("/")[-1])]
+            for obj in workplane["objects"]
+        ]
+    del serialized["shapes"]
+
+    restored = adapter.validate_python(serialized)
+    assert abs(restored.val().Volume() - 1) < 1e-10
+
+
+def test_collect_related_workplanes_order():
+    """Workplanes are collected parents first, also for very long chains."""
+    wp = cq.Workplane("XY").box(1, 1, 1).tag("base")
+    for _ in range(2000):
+        wp = wp.newObject(wp.objects)
+
+    collected = collect_related_workplanes(wp)
+    assert len(collected) == 2002
+    positions = {id(w): i for i, w in enumerate(collected)}
+    for w in collected:
+        if w.parent is not None:
+            assert positions[id(w.parent)] < positions[id(w)]
+
+    restored = TypeAdapter(cq.Workplane).validate_json(
+        TypeAdapter(cq.Workplane).dump_json(wp)
+    )
+    assert restored.ctx.tags["base"].val() is restored.val()
+
+
+def test_workplane_deterministic_output():
+    """Equal workplanes serialize to identical bytes."""
+
+    def build():
+        return cq.Workplane("XY").box(1, 1, 1).tag("base").faces(">Z").circle(0.2)
+
+    adapter = TypeAdapter(cq.Workplane)
+    first = build()
+    assert adapter.dump_json(first) == adapter.dump_json(first)
+    assert adapter.dump_json(first) == adapter.dump_json(build())
+
+
+def test_workplane_object_tags():
+    """Objects are tagged with their type, untagged payloads are still accepted."""
+    objects = [
+        cq.Vector(1, 2, 3),
+        cq.Location((1, 0, 0), (0, 0, 1), 45),
+        cq.Solid.makeBox(1, 1, 1),
+        cq.Sketch().rect(1, 1),
+    ]
+    wp = cq.Workplane("XY").newObject(objects)
+    adapter = TypeAdapter(cq.Workplane)
+
+    serialized = json.loads(adapter.dump_json(wp))
+    serialized_objects = serialized["workplanes"]["1"]["objects"]
+    assert [obj.get("type") for obj in serialized_objects] == [
+        "Vector",
+        "Location",
+        None,
+        "Sketch",
+    ]
+    assert serialized["shapes"][0]["type"] == "Solid"
+
+    restored = adapter.validate_json(json.dumps(serialized))
+    assert [type(obj) for obj in restored.objects] == [type(obj) for obj in objects]
+
+    for obj in serialized_objects:
+        obj.pop("type", None)
+    restored = adapter.validate_json(json.dumps(serialized))
+    assert [type(obj) for obj in restored.objects] == [type(obj) for obj in objects]
+    assert restored.objects[1].toTuple()[1][2] == pytest.approx(45)
+
+
+def test_workplane_object_invalid_tag():
+    serialized = json.loads(
+        TypeAdapter(cq.Workplane).dump_json(cq.Workplane().newObject([cq.Vector()]))
+    )
+    serialized["workplanes"]["1"]["objects"][0]["type"] = "Unknown"
+    with pytest.raises(ValueError):
+        TypeAdapter(cq.Workplane).validate_json(json.dumps(serialized))